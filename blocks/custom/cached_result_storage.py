@@ -0,0 +1,107 @@
+"""
+Result storage block that keeps a local on-disk copy of every result it reads or writes.
+Results are looked up in cache_dir by their storage key before anything is fetched from S3,
+so flow runs on the same machine reading the results of earlier ones (e.g. through the API)
+don't download them again.
+Result keys are never overwritten, so cached entries don't go stale.
+Once cache_dir grows above max_size_mb, the least recently used entries are evicted
+down to 90% of it. The directory is only scanned when a running estimate of its size crosses the limit,
+not on every write.
+
+python blocks/custom/cached_result_storage.py
+Then, use it as result storage:
+@flow(persist_result=True, result_storage="cached-result-storage/dev")
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Tuple
+import anyio
+from prefect.filesystems import S3, WritableFileSystem
+from prefect.utilities.asyncutils import sync_compatible
+
+# cache dir: estimated size in bytes, only rescanned once the estimate exceeds max_size_mb
+_CACHE_SIZES: Dict[Path, int] = {}
+_LOCK = threading.Lock()
+# eviction goes below max_size_mb, so that the next writes don't need to rescan right away
+LOW_WATER_MARK = 0.9
+
+
+class CachedResultStorage(WritableFileSystem):
+    _block_type_name = "Cached Result Storage"
+    _logo_url = "https://images.ctfassets.net/gm98wzqotmnx/1jbV4lceHOjGgunX15lUwT/db88e184d727f721575aeb054a37e277/aws.png?h=250"
+
+    remote: S3
+    cache_dir: str = "~/.prefect/result-cache"
+    max_size_mb: int = 1024
+
+    def _cache_path(self, path: str) -> Path:
+        # the bucket path is part of the key, so that blocks pointing to other buckets don't collide
+        key = hashlib.sha256(f"{self.remote.bucket_path}/{path}".encode()).hexdigest()
+        return Path(self.cache_dir).expanduser() / key
+
+    def _read_cached(self, path: str) -> bytes:
+        cache_path = self._cache_path(path)
+        content = cache_path.read_bytes()
+        cache_path.touch()  # the mtime tracks the last access for LRU eviction
+        return content
+
+    def _write_cached(self, path: str, content: bytes) -> None:
+        cache_path = self._cache_path(path)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # written to a temporary file first, so that concurrent readers never see partial content
+        with tempfile.NamedTemporaryFile(dir=cache_path.parent, delete=False) as tmp:
+            tmp.write(content)
+        os.replace(tmp.name, cache_path)
+        with _LOCK:
+            estimate = _CACHE_SIZES.get(cache_path.parent)
+            if estimate is not None:
+                estimate = _CACHE_SIZES[cache_path.parent] = estimate + len(content)
+        # the estimate misses writes of other processes, which are counted again by the next scan
+        if estimate is None or estimate > self.max_size_mb * 1024**2:
+            self._evict(cache_path.parent)
+
+    def _evict(self, cache_dir: Path) -> None:
+        entries: List[Tuple[float, int, Path]] = []
+        for entry in os.scandir(cache_dir):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:  # evicted by another process in the meantime
+                continue
+            entries.append((stat.st_mtime, stat.st_size, Path(entry.path)))
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_size_mb * 1024**2:
+            for _, size, path in sorted(entries):  # least recently used first
+                if total <= self.max_size_mb * 1024**2 * LOW_WATER_MARK:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+        with _LOCK:
+            _CACHE_SIZES[cache_dir] = total
+
+    @sync_compatible
+    async def read_path(self, path: str) -> bytes:
+        try:
+            return await anyio.to_thread.run_sync(self._read_cached, path)
+        except FileNotFoundError:
+            content = await self.remote.read_path(path)
+            await anyio.to_thread.run_sync(self._write_cached, path, content)
+            return content
+
+    @sync_compatible
+    async def write_path(self, path: str, content: bytes) -> str:
+        written = await self.remote.write_path(path, content)
+        # results are usually read back by downstream tasks on the same machine
+        await anyio.to_thread.run_sync(self._write_cached, path, content)
+        return written
+
+
+def create_cached_result_storage_block():
+    cached_storage = CachedResultStorage(remote=S3.load("dev"))
+    cached_storage.save("dev", overwrite=True)
+
+
+if __name__ == "__main__":
+    create_cached_result_storage_block()
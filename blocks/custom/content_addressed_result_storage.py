@@ -0,0 +1,96 @@
+"""
+Result storage block that stores every distinct result only once.
+A result is written to blobs/<sha256 of its content>, unless a blob with that hash already exists,
+and its storage key (refs/<key>) only references that blob. Mapped tasks returning the same values,
+e.g. transform.map() over repeated inputs, then write one large object instead of one per task run.
+Each task run still writes its reference, which is only 64 bytes.
+
+The references double as the index for garbage collection:
+collect_garbage() deletes the blobs that are no longer referenced by any key.
+A blob written again is rewritten when it is older than refresh_after seconds, so that its mtime
+tells when it was last referenced, and collect_garbage() keeps it for another grace_period
+even if it was unreferenced in the meantime.
+
+pip install s3fs
+python blocks/custom/content_addressed_result_storage.py
+Then, use it as result storage:
+@flow(persist_result=True, result_storage="content-addressed-result-storage/dev")
+"""
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+import anyio
+from prefect.filesystems import S3, WritableFileSystem
+from prefect.utilities.asyncutils import sync_compatible
+
+
+class ContentAddressedResultStorage(WritableFileSystem):
+    _block_type_name = "Content Addressed Result Storage"
+    _logo_url = "https://images.ctfassets.net/gm98wzqotmnx/1jbV4lceHOjGgunX15lUwT/db88e184d727f721575aeb054a37e277/aws.png?h=250"
+
+    remote: S3
+    # must be well below the grace_period of collect_garbage()
+    refresh_after: int = 600
+
+    def _path(self, path: str) -> str:
+        return self.remote.filesystem._resolve_path(path)
+
+    def _write_blob(self, digest: str, content: bytes) -> None:
+        fs = self.remote.filesystem.filesystem
+        blob_path = self._path(f"blobs/{digest}")
+        try:
+            modified: Optional[float] = fs.modified(blob_path).timestamp()
+        except FileNotFoundError:
+            modified = None
+        # S3 can't touch an object, rewriting the same content is what refreshes its mtime
+        if modified is None or modified < time.time() - self.refresh_after:
+            fs.pipe_file(blob_path, content)
+
+    @sync_compatible
+    async def read_path(self, path: str) -> bytes:
+        digest = await self.remote.read_path(f"refs/{path}")
+        return await self.remote.read_path(f"blobs/{digest.decode()}")
+
+    @sync_compatible
+    async def write_path(self, path: str, content: bytes) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        # the blob is written before the reference, so that a reference never points to nothing
+        await anyio.to_thread.run_sync(self._write_blob, digest, content)
+        return await self.remote.write_path(f"refs/{path}", digest.encode())
+
+    def collect_garbage(self, grace_period: int = 3600, max_workers: int = 32) -> Dict[str, int]:
+        """
+        Deletes the blobs that no reference points to. Blobs written or reused within the last grace_period
+        seconds are kept, as their reference may not be written yet. Delete references (e.g. of expired results) first.
+        """
+        fs = self.remote.filesystem.filesystem
+        refs = fs.find(self._path("refs"))
+        with ThreadPoolExecutor(max_workers) as pool:
+            referenced = {digest.decode() for digest in pool.map(fs.cat_file, refs)}
+            blobs = fs.find(self._path("blobs"), detail=True)
+            unreferenced = [path for path in blobs if digest_of(path) not in referenced]
+            modified = pool.map(lambda path: fs.modified(path).timestamp(), unreferenced)
+            cutoff = time.time() - grace_period
+            expired = [path for path, ts in zip(unreferenced, modified) if ts < cutoff]
+        if expired:
+            fs.rm(expired)
+        return dict(
+            references=len(refs),
+            blobs=len(blobs),
+            deleted=len(expired),
+            bytes_reclaimed=sum(blobs[path]["size"] for path in expired),
+        )
+
+
+def digest_of(blob_path: str) -> str:
+    return blob_path.rsplit("/", 1)[-1]
+
+
+def create_content_addressed_result_storage_block():
+    storage = ContentAddressedResultStorage(remote=S3.load("dev"))
+    storage.save("dev", overwrite=True)
+
+
+if __name__ == "__main__":
+    create_content_addressed_result_storage_block()
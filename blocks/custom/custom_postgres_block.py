@@ -1,10 +1,25 @@
 """
 docker run --restart always --name postgres14 --net dev -v postgres_data:/var/lib/postgresql/data -p 5432:5432 -d -e POSTGRES_PASSWORD=postgres postgres:14
-"""
 
-from typing import Optional
+get_engine() returns one pooled SQLAlchemy engine per process and connection parameters,
+so that tasks running in the same process share connections instead of each opening their own.
+Check out connections with connect() or begin() rather than from the engine directly,
+so that the time spent waiting for a free connection shows up in get_pool_metrics().
+Combine it with a concurrency limit on the "db" tag (see tag_based_concurrency_control.py)
+to keep the number of connections below max_connections.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
 from prefect.blocks.core import Block
 from pydantic import SecretStr
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Connection, Engine
+
+_ENGINES: Dict[Tuple, Engine] = {}
+_POOL_METRICS: Dict[Tuple, Dict[str, float]] = {}
+_LOCK = threading.Lock()
 
 
 class PostgreSQL(Block):
@@ -16,6 +31,11 @@ class PostgreSQL(Block):
     db_name: Optional[str] = "postgres"
     db_hostname: Optional[str] = "localhost"
     db_port: Optional[int] = 5432
+    pool_size: Optional[int] = 5
+    max_overflow: Optional[int] = 10
+    pool_timeout: Optional[int] = 30
+    pool_pre_ping: Optional[bool] = True
+    pool_recycle: Optional[int] = 1800
 
     def get_connection_string(self):
         usr = self.user_name.get_secret_value()
@@ -24,6 +44,69 @@ class PostgreSQL(Block):
             f"postgresql://{usr}:{pwd}@{self.db_hostname}:{self.db_port}/{self.db_name}"
         )
 
+    def _engine_key(self) -> Tuple:
+        return (
+            self.get_connection_string(),
+            self.pool_size,
+            self.max_overflow,
+            self.pool_timeout,
+            self.pool_pre_ping,
+            self.pool_recycle,
+        )
+
+    def get_engine(self) -> Engine:
+        key = self._engine_key()
+        with _LOCK:
+            if key not in _ENGINES:
+                engine = create_engine(
+                    self.get_connection_string(),
+                    pool_size=self.pool_size,
+                    max_overflow=self.max_overflow,
+                    pool_timeout=self.pool_timeout,
+                    pool_pre_ping=self.pool_pre_ping,
+                    pool_recycle=self.pool_recycle,
+                )
+                metrics = dict(connects=0, checkouts=0, wait_seconds=0.0, max_wait_seconds=0.0)
+                event.listen(engine, "connect", lambda *args: _increment(metrics, "connects"))
+                event.listen(engine, "checkout", lambda *args: _increment(metrics, "checkouts"))
+                _ENGINES[key] = engine
+                _POOL_METRICS[key] = metrics
+            return _ENGINES[key]
+
+    @contextmanager
+    def connect(self) -> Iterator[Connection]:
+        """Checks out a connection from the shared pool and records how long that took."""
+        engine = self.get_engine()
+        metrics = _POOL_METRICS[self._engine_key()]
+        start = time.perf_counter()
+        with engine.connect() as conn:
+            wait = time.perf_counter() - start
+            with _LOCK:
+                metrics["wait_seconds"] += wait
+                metrics["max_wait_seconds"] = max(metrics["max_wait_seconds"], wait)
+            yield conn
+
+    @contextmanager
+    def begin(self) -> Iterator[Connection]:
+        """Like Engine.begin(): a connection from connect() within a transaction committed on exit."""
+        with self.connect() as conn, conn.begin():
+            yield conn
+
+    def get_pool_metrics(self) -> Dict[str, float]:
+        pool = self.get_engine().pool
+        return dict(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            **_POOL_METRICS[self._engine_key()],
+        )
+
+
+def _increment(metrics: Dict[str, float], name: str) -> None:
+    with _LOCK:
+        metrics[name] += 1
+
 
 def create_postgres_block():
     postgres_block = PostgreSQL(user_name="postgres", password="postgres")
@@ -3,45 +3,203 @@ brew install postgresql
 pip install psycopg2 pandas
 python blocks/custom/custom_postgres_block.py
 Then, run this flow
+
+All datasets are extracted concurrently, and each load starts as soon as its own extract finished.
+The extract streams the CSV file to local disk in chunks, and the load streams it from there
+into a staging table with COPY FROM STDIN, which is much faster than the row-by-row INSERTs of df.to_sql().
+Neither of them holds the whole dataset in memory.
+The staging table then replaces the target table within one transaction,
+so readers never see an empty or half-loaded table.
+
+With incremental=True, tables are upserted instead: rows are matched on the primary key
+declared in TABLES, and only new or changed rows get written with INSERT ... ON CONFLICT DO UPDATE.
+When a table has a column set on every update, declare it as updated_at: only rows not older than
+the watermark of the last run are then considered. The watermark of each table is stored
+in a JSON block named watermark-<table>, e.g. watermark-raw-orders.
+None of the datasets has such a column (order_date doesn't change when the status of an order does),
+so all their rows are compared.
+
+To test without GitHub, serve the CSV files locally and pass base_url:
+python -m http.server 8000 --directory data
 """
-from blocks.custom.custom_postgres_block import read_postgres_block
+import os
+import shutil
+import tempfile
+import urllib.request
+from blocks.custom.custom_postgres_block import PostgreSQL
 import pandas as pd
 from prefect import task, flow, get_run_logger
-from sqlalchemy import create_engine
+from prefect.blocks.system import JSON
+from sqlalchemy import text
 from sqlalchemy.engine import Connection
+from typing import List, Optional
 
+BASE_URL = "https://raw.githubusercontent.com/anna-geller/dbt_dwh_models/main/data"
 
-@task
-def load_df_to_db(
+# primary key and optional updated-at column used by incremental loads
+TABLES = {
+    "raw_customers": dict(primary_key=["id"]),
+    "raw_orders": dict(primary_key=["id"]),
+    "raw_payments": dict(primary_key=["id"]),
+}
+
+
+def copy_csv_to_table(db_conn: Connection, csv_path: str, table: str, columns: list) -> None:
+    columns = quote(columns)
+    # COPY isn't exposed by SQLAlchemy, so it goes through the psycopg2 cursor of this transaction
+    with db_conn.connection.cursor() as cursor, open(csv_path) as csv_file:
+        cursor.copy_expert(
+            f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER true)", csv_file
+        )
+
+
+def quote(columns: List[str]) -> str:
+    return ", ".join(f'"{column}"' for column in columns)
+
+
+def infer_columns(csv_path: str, chunk_rows: int) -> pd.DataFrame:
+    """
+    An empty DataFrame with the column types pandas infers from the whole file,
+    read in chunks so that the file is never held in memory as a whole.
+    """
+    # concatenating one row of each chunk applies the rules pandas uses to combine their types,
+    # e.g. a column with integers in the first chunk and decimals in a later one becomes a float
+    rows = [chunk.head(1) for chunk in pd.read_csv(csv_path, chunksize=chunk_rows)]
+    return pd.concat(rows).head(0)
+
+
+def table_exists(db_conn: Connection, schema: str, table_name: str) -> bool:
+    query = text("SELECT to_regclass(:table) IS NOT NULL")
+    return db_conn.execute(query, table=f"{schema}.{table_name}").scalar()
+
+
+def ensure_primary_key(
+    db_conn: Connection, schema: str, table_name: str, primary_key: List[str]
+) -> None:
+    # required by ON CONFLICT, also on tables created by a full load
+    query = text(
+        "SELECT count(*) FROM pg_constraint WHERE conrelid = to_regclass(:table) AND contype = 'p'"
+    )
+    if not db_conn.execute(query, table=f"{schema}.{table_name}").scalar():
+        pk = quote(primary_key)
+        db_conn.execute(f"ALTER TABLE {schema}.{table_name} ADD PRIMARY KEY ({pk});")
+
+
+def upsert_from_staging(
     db_conn: Connection,
-    df: pd.DataFrame,
+    schema: str,
+    table_name: str,
+    columns: List[str],
+    primary_key: List[str],
+    updated_at: Optional[str] = None,
+    watermark: Optional[str] = None,
+) -> int:
+    staging, target = f"{schema}.{table_name}_staging", f"{schema}.{table_name}"
+    updates = [c for c in columns if c not in primary_key]
+    where = f'WHERE "{updated_at}" >= :watermark' if updated_at and watermark else ""
+    excluded = ", ".join(f'EXCLUDED."{c}"' for c in updates)
+    current = ", ".join(f'{target}."{c}"' for c in updates)
+    # rows that didn't change are skipped rather than rewritten
+    on_conflict = (
+        f"DO UPDATE SET ({quote(updates)}) = ROW({excluded}) "
+        f"WHERE ({current}) IS DISTINCT FROM ({excluded})"
+        if updates
+        else "DO NOTHING"
+    )
+    query = f"""
+        INSERT INTO {target} ({quote(columns)})
+        SELECT {quote(columns)} FROM {staging} {where}
+        ON CONFLICT ({quote(primary_key)}) {on_conflict}
+    """
+    return db_conn.execute(text(query), watermark=watermark).rowcount
+
+
+def watermark_block_name(table_name: str) -> str:
+    return f"watermark-{table_name.replace('_', '-')}"
+
+
+def read_watermark(table_name: str) -> Optional[str]:
+    try:
+        return JSON.load(watermark_block_name(table_name)).value.get("watermark")
+    except ValueError:  # no block yet, i.e. the first incremental load
+        return None
+
+
+@task(tags=["db"])
+def load_csv_to_db(
+    db_block: PostgreSQL,
+    csv_path: str,
     table_name: str,
     schema: str = "dbt_dwh_models",
-) -> None:
-    db_conn.execute(f"DROP TABLE IF EXISTS {schema}.{table_name} CASCADE;")
-    df.to_sql(table_name, schema=schema, con=db_conn, index=False)
+    chunk_rows: int = 100_000,
+    incremental: bool = False,
+    primary_key: Optional[List[str]] = None,
+    updated_at: Optional[str] = None,
+) -> int:
+    logger = get_run_logger()
+    try:
+        staging = f"{table_name}_staging"
+        empty = infer_columns(csv_path, chunk_rows)
+        columns = list(empty.columns)
+        watermark = read_watermark(table_name) if incremental and updated_at else None
+        new_watermark = None
+        with db_block.begin() as db_conn:
+            db_conn.execute(f"DROP TABLE IF EXISTS {schema}.{staging};")
+            empty.to_sql(staging, schema=schema, con=db_conn, index=False)
+            copy_csv_to_table(db_conn, csv_path, f"{schema}.{staging}", columns)
+            rows = db_conn.execute(f"SELECT count(*) FROM {schema}.{staging};").scalar()
+            if updated_at:
+                query = f'SELECT max("{updated_at}")::text FROM {schema}.{staging};'
+                new_watermark = db_conn.execute(query).scalar()
+            if incremental and table_exists(db_conn, schema, table_name):
+                ensure_primary_key(db_conn, schema, table_name, primary_key)
+                rows = upsert_from_staging(
+                    db_conn, schema, table_name, columns, primary_key, updated_at, watermark
+                )
+                db_conn.execute(f"DROP TABLE {schema}.{staging};")
+            else:
+                db_conn.execute(f"DROP TABLE IF EXISTS {schema}.{table_name} CASCADE;")
+                db_conn.execute(f"ALTER TABLE {schema}.{staging} RENAME TO {table_name};")
+                if incremental:  # the next incremental loads upsert on it
+                    ensure_primary_key(db_conn, schema, table_name, primary_key)
+        if incremental and updated_at and new_watermark:
+            # saved only after the commit, so a failed load is retried from the old watermark
+            JSON(value=dict(watermark=new_watermark)).save(
+                watermark_block_name(table_name), overwrite=True
+            )
+    finally:
+        # the extracted file is only a temporary copy, also remove it when the load failed
+        os.remove(csv_path)
+    logger.info("%s rows written to %s.%s", rows, schema, table_name)
+    return rows
 
 
 @task
-def extract(dataset: str) -> None:
-    file = f"https://raw.githubusercontent.com/anna-geller/dbt_dwh_models/main/data/{dataset}.csv"
-    return pd.read_csv(file)
+def extract(dataset: str, base_url: str = BASE_URL) -> str:
+    with urllib.request.urlopen(f"{base_url}/{dataset}.csv") as response:
+        with tempfile.NamedTemporaryFile("wb", suffix=".csv", delete=False) as csv_file:
+            shutil.copyfileobj(response, csv_file, length=1024 * 1024)
+    return csv_file.name
 
 
 @flow
-def extract_and_load():
+def extract_and_load(base_url: str = BASE_URL, incremental: bool = False):
     logger = get_run_logger()
-    conn_string = read_postgres_block()
-    db_engine = create_engine(conn_string)
-    conn = db_engine.connect()
-    conn.execute("CREATE SCHEMA IF NOT EXISTS dbt_dwh_models;")
-
-    datasets = ["raw_customers", "raw_orders", "raw_payments"]
-    for dataset in datasets:
-        df = extract(dataset)
-        load_df_to_db(conn, df, dataset)
-        logger.info("dataset %s loaded", dataset)
-    conn.close()
+    postgres_block = PostgreSQL.load("dev")
+    # the same pooled engine is shared by all flow and task runs within this process
+    with postgres_block.begin() as conn:
+        conn.execute("CREATE SCHEMA IF NOT EXISTS dbt_dwh_models;")
+
+    loads = {}
+    for dataset, keys in TABLES.items():
+        csv_path = extract.submit(dataset, base_url)
+        # passing the future makes this load wait only for its own extract
+        loads[dataset] = load_csv_to_db.submit(
+            postgres_block, csv_path, dataset, incremental=incremental, **keys
+        )
+    for dataset, load in loads.items():
+        logger.info("dataset %s loaded: %s rows written", dataset, load.result())
+    logger.info("Connection pool: %s", postgres_block.get_pool_metrics())
 
 
 if __name__ == "__main__":
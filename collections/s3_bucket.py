@@ -2,18 +2,51 @@ import asyncio
 from prefect import flow, task, get_run_logger
 from prefect_aws import AwsCredentials
 from prefect_aws.s3 import S3Bucket
+from s3_transfer import download_directory, upload_directory
 
 
 @task
-async def upload_dir(s3_bucket: S3Bucket, local_path: str, bucket_path: str) -> None:
+async def upload_dir(
+    s3_bucket: S3Bucket,
+    local_path: str,
+    bucket_path: str,
+    sync: bool = False,
+    delete: bool = False,
+) -> dict:
     logger = get_run_logger()
-    files = await s3_bucket.put_directory(to_path=bucket_path, local_path=local_path)
-    logger.info("Nr of files %s", files)
+    stats = await upload_directory(
+        s3_bucket, local_path=local_path, bucket_path=bucket_path, sync=sync, delete=delete
+    )
+    logger.info(
+        "Uploaded %s files (%s bytes) at %s MB/s, %s files already in sync",
+        stats["objects"],
+        stats["bytes"],
+        stats["mb_per_sec"],
+        stats["skipped"],
+    )
+    return stats
 
 
 @task
-async def download_dir(s3_bucket: S3Bucket, bucket_path: str, local_path: str) -> None:
-    await s3_bucket.get_directory(from_path=bucket_path, local_path=local_path)
+async def download_dir(
+    s3_bucket: S3Bucket,
+    bucket_path: str,
+    local_path: str,
+    sync: bool = False,
+    delete: bool = False,
+) -> dict:
+    logger = get_run_logger()
+    stats = await download_directory(
+        s3_bucket, bucket_path=bucket_path, local_path=local_path, sync=sync, delete=delete
+    )
+    logger.info(
+        "Downloaded %s files (%s bytes) at %s MB/s, %s files already in sync",
+        stats["objects"],
+        stats["bytes"],
+        stats["mb_per_sec"],
+        stats["skipped"],
+    )
+    return stats
 
 
 @flow
@@ -23,8 +56,9 @@ async def aws_s3_bucket() -> None:
         bucket_name="prefect-orion",
         aws_credentials=aws_creds,
     )
-    await upload_dir(s3_bucket, "docs", "docs2")
-    await download_dir(s3_bucket, "docs2", "docs4")
+    # sync=True: only transfer what changed since the last run
+    await upload_dir(s3_bucket, "docs", "docs2", sync=True)
+    await download_dir(s3_bucket, "docs2", "docs4", sync=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,222 @@
+"""
+Concurrent transfers between a local directory and an S3Bucket block.
+Files are listed and transferred at the same time: a producer walks the local directory
+(or pages through the bucket listing) and feeds a bounded queue consumed by max_concurrency workers.
+Files above multipart_threshold are uploaded and downloaded in parts, also concurrently.
+
+With sync=True, only files that differ are transferred, rsync-style: a file is skipped when it has
+the same size as its counterpart and either hasn't been modified since the upload/download
+(downloaded files get the LastModified of their object as mtime) or its MD5 matches the ETag. With delete=True, files missing on the source side are deleted too.
+
+As with put_directory, bucket_path is relative to the basepath of the S3Bucket block.
+
+Works the same with MinIO: create the S3Bucket block with minio_credentials
+and endpoint_url="http://localhost:9000" (see blocks/storage_blocks/minio.py).
+"""
+import asyncio
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
+from prefect_aws.s3 import S3Bucket
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional, Tuple
+
+MB = 1024**2
+
+
+def get_s3_client(s3_bucket: S3Bucket):
+    if s3_bucket.minio_credentials:
+        session = s3_bucket.minio_credentials.get_boto3_session()
+        return session.client("s3", endpoint_url=s3_bucket.endpoint_url)
+    return s3_bucket.aws_credentials.get_boto3_session().client("s3")
+
+
+def resolve_bucket_path(s3_bucket: S3Bucket, bucket_path: str) -> str:
+    # as with put_directory (write_path), bucket paths are relative to the basepath of the block
+    parts = (str(s3_bucket.basepath or ""), bucket_path or "")
+    return "/".join(part.strip("/") for part in parts if part.strip("/"))
+
+
+def walk_files(local_path: str, bucket_path: str) -> Iterator[Tuple[str, str]]:
+    for root, _, files in os.walk(local_path):
+        for name in files:
+            path = os.path.join(root, name)
+            key = os.path.relpath(path, local_path).replace(os.sep, "/")
+            yield path, f"{bucket_path}/{key}" if bucket_path else key
+
+
+async def iterate_in_thread(iterator: Iterator, pool: ThreadPoolExecutor) -> AsyncIterator:
+    # blocking iterators (os.walk, boto3 paginators) are advanced without blocking the event loop
+    loop = asyncio.get_running_loop()
+    sentinel = object()
+    while True:
+        item = await loop.run_in_executor(pool, next, iterator, sentinel)
+        if item is sentinel:
+            return
+        yield item
+
+
+def md5_digest(path: str, block_size: int = MB) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def is_in_sync(path: str, obj: dict, upload: bool) -> bool:
+    stat = os.stat(path)
+    if stat.st_size != obj["Size"]:
+        return False
+    modified = obj["LastModified"].timestamp()
+    # uploads: the object must not be older than the file, i.e. the file wasn't modified since the upload;
+    # downloads: the file still has the mtime set by the download, a file edited since then has another one
+    if (stat.st_mtime <= modified) if upload else abs(stat.st_mtime - modified) < 1e-3:
+        return True
+    etag = obj["ETag"].strip('"')
+    # the ETag of multipart uploads is not the MD5 of the file (it contains a "-")
+    return "-" not in etag and md5_digest(path) == etag
+
+
+def list_objects(client, bucket: str, bucket_path: str) -> Iterator[dict]:
+    # with a trailing "/", so that "docs2" doesn't also list "docs22/..." or "docs2_archive/..."
+    prefix = f"{bucket_path}/" if bucket_path else ""
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if not obj["Key"].endswith("/"):  # folder placeholders
+                yield obj
+
+
+def delete_objects(client, bucket: str, keys: list) -> None:
+    for i in range(0, len(keys), 1000):  # max batch size of DeleteObjects
+        objects = [dict(Key=key) for key in keys[i : i + 1000]]
+        client.delete_objects(Bucket=bucket, Delete=dict(Objects=objects, Quiet=True))
+
+
+async def run_transfers(
+    items: AsyncIterator[tuple],
+    transfer_one: Callable[..., Optional[int]],
+    pool: ThreadPoolExecutor,
+    max_concurrency: int,
+) -> Dict[str, float]:
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=max_concurrency * 2)
+    stats = dict(objects=0, bytes=0, skipped=0)
+    start = time.perf_counter()
+
+    async def produce():
+        async for item in items:
+            await queue.put(item)  # waits while the workers are busy
+        for _ in range(max_concurrency):
+            await queue.put(None)
+
+    async def work():
+        while (item := await queue.get()) is not None:
+            transferred = await loop.run_in_executor(pool, transfer_one, *item)
+            if transferred is None:  # already in sync
+                stats["skipped"] += 1
+            else:
+                stats["bytes"] += transferred
+                stats["objects"] += 1
+
+    tasks = [asyncio.create_task(produce())]
+    tasks += [asyncio.create_task(work()) for _ in range(max_concurrency)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    seconds = time.perf_counter() - start
+    stats["seconds"] = round(seconds, 3)
+    stats["mb_per_sec"] = round(stats["bytes"] / MB / seconds, 2) if seconds else 0
+    return stats
+
+
+async def upload_directory(
+    s3_bucket: S3Bucket,
+    local_path: str,
+    bucket_path: str,
+    max_concurrency: int = 16,
+    multipart_threshold: int = 8 * MB,
+    sync: bool = False,
+    delete: bool = False,
+) -> Dict[str, float]:
+    client = get_s3_client(s3_bucket)  # boto3 clients are thread-safe
+    bucket = s3_bucket.bucket_name
+    bucket_path = resolve_bucket_path(s3_bucket, bucket_path)
+    config = TransferConfig(multipart_threshold=multipart_threshold, max_concurrency=4)
+    remote = {}
+    if sync or delete:
+        remote = {obj["Key"]: obj for obj in list_objects(client, bucket, bucket_path)}
+    uploaded = set()
+
+    def upload_one(path: str, key: str) -> Optional[int]:
+        uploaded.add(key)
+        if sync and key in remote and is_in_sync(path, remote[key], upload=True):
+            return None
+        client.upload_file(path, bucket, key, Config=config)
+        return os.path.getsize(path)
+
+    # one extra thread for the listing
+    with ThreadPoolExecutor(max_workers=max_concurrency + 1) as pool:
+        files = iterate_in_thread(walk_files(local_path, bucket_path), pool)
+        stats = await run_transfers(files, upload_one, pool, max_concurrency)
+    if delete:
+        extraneous = sorted(remote.keys() - uploaded)
+        delete_objects(client, bucket, extraneous)
+        stats["deleted"] = len(extraneous)
+    return stats
+
+
+def local_target(local_path: str, bucket_path: str, key: str) -> str:
+    target = os.path.normpath(os.path.join(local_path, os.path.relpath(key, bucket_path or ".")))
+    # keys such as "docs2/../../.bashrc" must not be written outside of local_path
+    root = os.path.abspath(local_path)
+    if os.path.commonpath([root, os.path.abspath(target)]) != root:
+        raise ValueError(f"Object {key!r} would be downloaded outside of {local_path!r}")
+    return target
+
+
+async def download_directory(
+    s3_bucket: S3Bucket,
+    bucket_path: str,
+    local_path: str,
+    max_concurrency: int = 16,
+    multipart_threshold: int = 8 * MB,
+    sync: bool = False,
+    delete: bool = False,
+) -> Dict[str, float]:
+    client = get_s3_client(s3_bucket)
+    bucket = s3_bucket.bucket_name
+    bucket_path = resolve_bucket_path(s3_bucket, bucket_path)
+    config = TransferConfig(multipart_threshold=multipart_threshold, max_concurrency=4)
+    downloaded = set()
+
+    def download_one(obj: dict) -> Optional[int]:
+        target = local_target(local_path, bucket_path, obj["Key"])
+        downloaded.add(target)
+        if sync and os.path.exists(target) and is_in_sync(target, obj, upload=False):
+            return None
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        client.download_file(bucket, obj["Key"], target, Config=config)
+        # so that the next sync can skip it based on mtime without computing the MD5
+        modified = obj["LastModified"].timestamp()
+        os.utime(target, (modified, modified))
+        return os.path.getsize(target)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency + 1) as pool:
+        listing = ((obj,) for obj in list_objects(client, bucket, bucket_path))
+        objects = iterate_in_thread(listing, pool)
+        stats = await run_transfers(objects, download_one, pool, max_concurrency)
+    if delete:
+        extraneous = [
+            path
+            for path, _ in walk_files(local_path, bucket_path)
+            if os.path.normpath(path) not in downloaded
+        ]
+        for path in extraneous:
+            os.remove(path)
+        stats["deleted"] = len(extraneous)
+    return stats
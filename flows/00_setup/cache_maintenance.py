@@ -0,0 +1,215 @@
+"""
+Tasks with cache_key_fn and cache_expiration leave their results in result storage after the cache expired,
+and nothing ever deletes them. This flow looks up the results of all task runs through the API and deletes:
+- expired cached results: referenced only by task run states whose cache_expiration has passed
+- orphaned results (include_orphans=True): result files in the result storage that no flow or task run
+  references, e.g. because the runs were deleted. Files referenced through any block are kept, also when
+  several blocks share the same location, and so are files that aren't results (e.g. deployment files).
+  Files younger than grace_period are kept as well, as their run may not have reported its state yet.
+Files are deleted in bulk, concurrently per storage block, and the bytes reclaimed are reported per task.
+
+python flows/00_setup/cache_maintenance.py
+"""
+import json
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, Dict, Optional, Set, Tuple
+from uuid import UUID
+import fsspec
+import pendulum
+from prefect import flow, get_client, get_run_logger, task
+from prefect.blocks.core import Block
+from prefect.filesystems import LocalFileSystem, RemoteFileSystem
+
+# registers the custom result storage blocks, so that their block documents can be loaded
+import blocks.custom.cached_result_storage  # noqa: F401
+import blocks.custom.content_addressed_result_storage  # noqa: F401
+
+ORPHANED = "(orphaned)"
+# a PersistedResultBlob starts with its serializer settings, followed by the data
+RESULT_PATTERN = re.compile(rb'\s*\{\s*"serializer"\s*:\s*')
+DATA_PATTERN = re.compile(rb'\s*,\s*"data"\s*:')
+
+
+async def read_all(read, page_size: int = 200) -> list:
+    runs, offset = [], 0
+    while True:
+        page = await read(limit=page_size, offset=offset)
+        runs += page
+        offset += page_size
+        if len(page) < page_size:
+            return runs
+
+
+def result_reference(state) -> Optional[Tuple[UUID, str]]:
+    data = state.data.dict() if hasattr(state.data, "dict") else state.data
+    if isinstance(data, dict) and data.get("storage_key"):
+        return UUID(str(data["storage_block_id"])), data["storage_key"]
+    return None
+
+
+def get_filesystem(block: Block) -> Tuple[fsspec.AbstractFileSystem, Callable[[str], str]]:
+    """The fsspec filesystem of a storage block and how it maps storage keys to paths on it."""
+    # blocks/custom/content_addressed_result_storage.py keeps a reference per storage key under refs/
+    prefix = "refs/" if hasattr(block, "collect_garbage") else ""
+    block = getattr(block, "remote", block)  # blocks/custom/*_result_storage.py
+    if isinstance(block, LocalFileSystem):
+        return fsspec.filesystem("file"), lambda key: str(block._resolve_path(prefix + key))
+    remote = block if isinstance(block, RemoteFileSystem) else block.filesystem
+    return remote.filesystem, lambda key: remote._resolve_path(prefix + key)
+
+
+@task
+async def find_cached_results() -> Dict[UUID, Dict[str, Tuple[str, bool]]]:
+    """Storage block id: {storage key: (task name, whether the key can be deleted)}."""
+    now = pendulum.now("UTC")
+    results = defaultdict(dict)
+    async with get_client() as client:
+        task_runs = await read_all(client.read_task_runs)
+        flow_runs = await read_all(client.read_flow_runs)
+    # task run names are "<task name>-<task key hash>-<index>", flow results are reported per flow run
+    runs = [(run, run.name.rsplit("-", 2)[0]) for run in task_runs]
+    runs += [(run, run.name) for run in flow_runs]
+    for run, task_name in runs:
+        reference = run.state and result_reference(run.state)
+        if not reference:
+            continue
+        block_id, key = reference
+        expiration = run.state.state_details.cache_expiration
+        expired = expiration is not None and expiration < now
+        _, deletable = results[block_id].get(key, (task_name, True))
+        # a result referenced by any run that still needs it must stay
+        results[block_id][key] = (task_name, deletable and expired)
+    return dict(results)
+
+
+async def load_block(block_id: UUID) -> Block:
+    async with get_client() as client:
+        return Block._from_block_document(await client.read_block_document(block_id))
+
+
+@task
+async def find_referenced_paths(results: Dict[UUID, Dict[str, Tuple[str, bool]]]) -> Set[str]:
+    """
+    Paths of all results referenced by any run, through any block. Blocks may share the same location,
+    e.g. s3/dev and cached-result-storage/dev, so orphans of one block must not be results of another.
+    """
+    referenced = set()
+    for block_id, keys in results.items():
+        fs, resolve_path = get_filesystem(await load_block(block_id))
+        # e.g. s3fs strips the s3:// protocol in listings
+        referenced |= {fs._strip_protocol(resolve_path(key)) for key in keys}
+    return referenced
+
+
+def is_result_file(fs: fsspec.AbstractFileSystem, path: str) -> bool:
+    """Whether a file is a PersistedResultBlob, judging from its beginning only."""
+    head = fs.cat_file(path, start=0, end=64 * 1024)
+    match = RESULT_PATTERN.match(head)
+    if not match:
+        return False
+    try:
+        text = head[match.end() :].decode(errors="replace")
+        serializer, end = json.JSONDecoder().raw_decode(text)
+    except ValueError:
+        return False
+    rest = text[end:].encode()
+    return isinstance(serializer, dict) and "type" in serializer and bool(DATA_PATTERN.match(rest))
+
+
+@task
+async def delete_results(
+    block_id: UUID,
+    results: Dict[str, Tuple[str, bool]],
+    include_orphans: bool = False,
+    grace_period: timedelta = timedelta(hours=1),
+    max_workers: int = 16,
+    dry_run: bool = False,
+    referenced: Optional[Set[str]] = None,
+) -> Dict[str, Dict[str, int]]:
+    """referenced: paths of the results of all blocks, required with include_orphans=True."""
+    logger = get_run_logger()
+    block = await load_block(block_id)
+    fs, resolve_path = get_filesystem(block)
+    paths = {resolve_path(key): name for key, (name, deletable) in results.items() if deletable}
+    cutoff = pendulum.now("UTC").subtract(seconds=grace_period.total_seconds()).timestamp()
+
+    with ThreadPoolExecutor(max_workers) as pool:
+        infos = dict(zip(paths, pool.map(safe_info, [fs] * len(paths), paths)))
+        if include_orphans:
+            # results live directly under the base path of the storage block
+            root = resolve_path("").rstrip("/")
+            candidates = {
+                path: info
+                for path, info in fs.find(root, maxdepth=1, detail=True).items()
+                if path not in referenced and modified(fs, path, info) < cutoff
+            }
+            # under refs/, content-addressed storage only keeps references, other files need checking
+            if hasattr(block, "collect_garbage"):
+                orphans = list(candidates)
+            else:
+                checks = pool.map(is_result_file, [fs] * len(candidates), candidates)
+                orphans = [path for path, is_result in zip(candidates, checks) if is_result]
+            for path in orphans:
+                paths[path], infos[path] = ORPHANED, candidates[path]
+        to_delete = [path for path, info in infos.items() if info is not None]
+        if not dry_run:
+            batches = [to_delete[i : i + 1000] for i in range(0, len(to_delete), 1000)]
+            list(pool.map(fs.rm, batches))
+
+    report = defaultdict(lambda: dict(results=0, bytes=0))
+    for path in to_delete:
+        report[paths[path]]["results"] += 1
+        report[paths[path]]["bytes"] += infos[path]["size"]
+    for name, stats in report.items():
+        mb = stats["bytes"] / 1024**2
+        logger.info("%s: %s results, %.1f MB reclaimed", name, stats["results"], mb)
+    if getattr(block, "collect_garbage", None) and not dry_run:
+        logger.info("Content-addressed blobs: %s", block.collect_garbage())
+    return dict(report)
+
+
+def safe_info(fs: fsspec.AbstractFileSystem, path: str) -> Optional[Dict]:
+    try:
+        return fs.info(path)
+    except FileNotFoundError:  # already deleted
+        return None
+
+
+def modified(fs: fsspec.AbstractFileSystem, path: str, info: Dict) -> float:
+    if "LastModified" in info:  # s3fs
+        return info["LastModified"].timestamp()
+    if "mtime" in info:  # local
+        return info["mtime"]
+    return fs.modified(path).timestamp()
+
+
+@flow
+def cache_maintenance(
+    include_orphans: bool = False,
+    grace_period: timedelta = timedelta(hours=1),
+    dry_run: bool = False,
+) -> Dict[str, Dict[str, int]]:
+    logger = get_run_logger()
+    results = find_cached_results()
+    referenced = find_referenced_paths(results) if include_orphans else None
+    deletions = [
+        delete_results.submit(
+            block_id, keys, include_orphans, grace_period, dry_run=dry_run, referenced=referenced
+        )
+        for block_id, keys in results.items()
+    ]
+    report = defaultdict(lambda: dict(results=0, bytes=0))
+    for deletion in deletions:
+        for name, stats in deletion.result().items():
+            report[name]["results"] += stats["results"]
+            report[name]["bytes"] += stats["bytes"]
+    total = sum(stats["bytes"] for stats in report.values())
+    logger.info("Reclaimed %.1f MB in total%s", total / 1024**2, " (dry run)" if dry_run else "")
+    return dict(report)
+
+
+if __name__ == "__main__":
+    cache_maintenance()
@@ -0,0 +1,38 @@
+"""
+With task_input_hash, the cache key of count_words() depends on the path only:
+after editing the file, the task would still return the cached, outdated result.
+content_input_hash also hashes the file contents. The file is only read again to compute the key
+when its size or modification time changed, and each DataFrame is hashed once per flow run.
+
+echo "hello prefect" > words.txt
+python flows/02_retries_and_caching/cache_file_contents.py
+echo "hello again" >> words.txt
+python flows/02_retries_and_caching/cache_file_contents.py
+"""
+from datetime import timedelta
+from pathlib import Path
+import pandas as pd
+from prefect import task, flow
+from utilities.cache import content_input_hash
+
+
+@task(cache_key_fn=content_input_hash, cache_expiration=timedelta(hours=1))
+def count_words(path: Path) -> pd.DataFrame:
+    words = path.read_text().split()
+    return pd.DataFrame({"word": words}).value_counts().reset_index(name="count")
+
+
+@task(cache_key_fn=content_input_hash, cache_expiration=timedelta(hours=1))
+def most_common(df: pd.DataFrame) -> str:
+    return df.sort_values("count").iloc[-1]["word"]
+
+
+@flow(log_prints=True)
+def cache_file_contents(path: str = "words.txt"):
+    counts = count_words(Path(path))
+    for _ in range(3):  # the DataFrame is hashed only for the first call
+        print(most_common(counts))
+
+
+if __name__ == "__main__":
+    cache_file_contents()
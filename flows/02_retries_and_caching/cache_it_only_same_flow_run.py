@@ -3,6 +3,7 @@ from prefect.tasks import task_input_hash
 from prefect import task, flow
 import time
 from prefect.context import get_run_context
+from utilities.cache import memory_cached
 
 
 def cache_within_flow_run(context, parameters):
@@ -12,6 +13,8 @@ def cache_within_flow_run(context, parameters):
     return key
 
 
+# the 4 calls after the first one are served from memory, without creating task runs
+@memory_cached(maxsize=16)
 @task(cache_key_fn=cache_within_flow_run, cache_expiration=timedelta(minutes=1), log_prints=True)
 def expensive_computation() -> int:
     print("running an expensive operation")
@@ -24,6 +27,7 @@ def cache_it():
     print(get_run_context().flow_run.id)
     for _ in range(5):
         expensive_computation()
+    print(expensive_computation.cache_info())
 
 
 if __name__ == "__main__":
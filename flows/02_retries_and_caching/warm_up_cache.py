@@ -0,0 +1,67 @@
+"""
+Scheduled runs of flows like cache_it.py pay the full cost of their cached tasks on the first run
+after the cache expired. This flow creates a warm-up flow run of a deployment shortly (lead_time) before
+each of its next scheduled runs, for each set of parameters. The warm-up run computes and persists
+the cached task results, so that the scheduled run a few minutes later is served from the cache.
+
+The cache_expiration of the tasks must be longer than lead_time, and their cache keys must not depend
+on the flow run (as opposed to cache_it_only_same_flow_run.py), e.g. task_input_hash.
+Running it again doesn't create duplicate warm-up runs, so it can itself be deployed on a schedule:
+
+prefect deployment build flows/02_retries_and_caching/warm_up_cache.py:warm_up_cache -n cache-it -q default \
+    --interval 3600 --params='{"deployment_name": "cache-it/dev"}' -a
+"""
+import asyncio
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+import pendulum
+from prefect import flow, get_client, get_run_logger
+from prefect.orion.schemas.states import Scheduled
+from prefect.utilities.hashing import hash_objects
+
+
+@flow
+async def warm_up_cache(
+    deployment_name: str,
+    parameter_sets: Optional[List[Dict[str, Any]]] = None,
+    lead_time: timedelta = timedelta(minutes=10),
+    next_runs: int = 1,
+) -> List[str]:
+    logger = get_run_logger()
+    async with get_client() as client:
+        deployment = await client.read_deployment_by_name(deployment_name)
+        if deployment.schedule is None:
+            raise ValueError(f"Deployment {deployment_name!r} has no schedule to warm up for.")
+        # the default parameters of the deployment, unless there are several sets of them
+        parameter_sets = parameter_sets or [{}]
+        start = pendulum.now("UTC").add(seconds=lead_time.total_seconds())
+        run_times = await deployment.schedule.get_dates(n=next_runs, start=start)
+        flow_runs = []
+        for run_time in run_times:
+            warm_up_time = run_time - lead_time
+            for overrides in parameter_sets:
+                parameters = {**deployment.parameters, **overrides}
+                # one warm-up run per scheduled run and parameters, however often this runs
+                key = hash_objects(str(deployment.id), run_time.isoformat(), parameters)
+                flow_run = await client.create_flow_run_from_deployment(
+                    deployment.id,
+                    parameters=parameters,
+                    state=Scheduled(scheduled_time=warm_up_time),
+                    name=f"cache-warm-up-{run_time:%Y%m%d-%H%M}",
+                    tags=["cache-warm-up"],
+                    idempotency_key=key,
+                )
+                logger.info(
+                    "Warm-up run %s of %s at %s for the run at %s with parameters %s",
+                    flow_run.name,
+                    deployment_name,
+                    warm_up_time,
+                    run_time,
+                    parameters,
+                )
+                flow_runs.append(str(flow_run.id))
+    return flow_runs
+
+
+if __name__ == "__main__":
+    asyncio.run(warm_up_cache(deployment_name="cache-it/dev"))
@@ -0,0 +1,33 @@
+"""
+pip install pyarrow
+python flows/03_results/arrow_serializer.py
+
+DataFrame results are persisted as zstd-compressed Arrow IPC files instead of pickles,
+any other result (such as the string returned by the flow) is still pickled.
+Compare both with: python flows/03_results/serializer_benchmark.py
+"""
+import numpy as np
+import pandas as pd
+from prefect import flow, task
+from utilities.serializers import ArrowSerializer
+
+
+@task(persist_result=True, result_serializer=ArrowSerializer(format="parquet"))
+def get_large_dataframe() -> pd.DataFrame:
+    return pd.DataFrame(np.random.default_rng(42).random((1_000_000, 10))).add_prefix("col_")
+
+
+@task(persist_result=True)
+def add_total(df: pd.DataFrame) -> pd.DataFrame:
+    return df.assign(total=df.sum(axis=1))
+
+
+@flow(result_serializer=ArrowSerializer())
+def flow_with_arrow_serializer():
+    df = get_large_dataframe()
+    add_total(df)  # inherits the Arrow IPC serializer from the flow
+    return "Hi from Results with DataFrames serialized with Arrow! 👋"
+
+
+if __name__ == "__main__":
+    flow_with_arrow_serializer()
@@ -0,0 +1,47 @@
+"""
+python blocks/custom/cached_result_storage.py
+Results are written to S3 (the s3/dev block) and to a local cache at the same time.
+Within a flow run, results are passed around in memory, so the cache only pays off
+when they are read back later on this machine, e.g. by another flow run loading them
+through the API as read_results() does: those reads are served from the local cache instead of S3.
+python flows/03_results/cached_result_storage_s3.py
+ls ~/.prefect/result-cache
+"""
+import asyncio
+import time
+from uuid import UUID
+from prefect import flow, get_client, get_run_logger, task
+from prefect.orion.schemas.filters import FlowRunFilter, FlowRunFilterId
+
+# registers the block type, so that the "cached-result-storage/dev" slug can be resolved
+from blocks.custom.cached_result_storage import CachedResultStorage  # noqa: F401
+
+
+@task(persist_result=True)
+def extract_numbers() -> list:
+    return list(range(1_000_000))
+
+
+@flow(persist_result=True, result_storage="cached-result-storage/dev")
+def cached_results() -> int:
+    numbers = extract_numbers()
+    return sum(numbers)
+
+
+@flow
+async def read_results(flow_run_id: UUID) -> None:
+    """A new flow run has none of these results in memory: they are read through the storage block."""
+    logger = get_run_logger()
+    async with get_client() as client:
+        flow_run = await client.read_flow_run(flow_run_id)
+        run_filter = FlowRunFilter(id=FlowRunFilterId(any_=[flow_run_id]))
+        task_runs = await client.read_task_runs(flow_run_filter=run_filter)
+    for run in [flow_run, *task_runs]:
+        start = time.perf_counter()
+        await run.state.result(fetch=True)
+        logger.info("Read the result of %s in %.3f seconds", run.name, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    state = cached_results(return_state=True)
+    asyncio.run(read_results(state.state_details.flow_run_id))  # served from ~/.prefect/result-cache
@@ -2,9 +2,13 @@
 https://github.com/PrefectHQ/prefect/pull/7164
 https://docs.python.org/3/library/lzma.html
 https://docs.python.org/3/library/bz2.html
+
+Which codec pays off depends on the payload, see: python flows/03_results/compression_benchmark.py
+AutoCompressedSerializer picks the codec per result instead.
 """
 from prefect import flow, task
 from prefect.serializers import CompressedSerializer
+from utilities.serializers import AutoCompressedSerializer
 
 
 @task(
@@ -16,9 +20,15 @@ def get_some_large_result():
     return 42
 
 
+@task(persist_result=True, result_serializer=AutoCompressedSerializer(policy="balanced"))
+def get_some_result_of_unknown_size():
+    return [{"user": "Marvin", "points": 42}] * 10_000
+
+
 @flow(result_serializer="compressed/pickle")
 def flow_with_compressed_serializer():
     get_some_large_result()
+    get_some_result_of_unknown_size()
     return "Hi from Results with task with compressed pickle serializer! 👋"
 
 
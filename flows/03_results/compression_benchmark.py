@@ -0,0 +1,100 @@
+"""
+Runs representative results through every codec and level available to the compressed serializers
+and reports the compression ratio and the compress/decompress throughput in MB/s of the uncompressed payload.
+It also shows which codec the "compressed/auto" serializer picks for each payload under each policy.
+
+pip install pyarrow  # utilities/serializers.py
+python flows/03_results/compression_benchmark.py > compression_benchmark.json
+"""
+import io
+import json
+import sys
+import time
+import numpy as np
+import pandas as pd
+from PIL import Image
+from prefect.serializers import JSONSerializer, PickleSerializer
+from typing import Callable, Dict, List
+from utilities.serializers import CODECS, AutoCompressedSerializer
+
+MB = 1024**2
+
+
+def small_int() -> bytes:
+    return PickleSerializer().dumps(42)
+
+
+def large_dataframe(rows: int = 1_000_000, seed: int = 42) -> bytes:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "id": np.arange(rows),
+            "amount": rng.random(rows).round(2),
+            "country": rng.choice(["DE", "PL", "US", "FR"], rows),
+        }
+    )
+    return PickleSerializer().dumps(df)
+
+
+def image_bytes(seed: int = 42) -> bytes:
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")  # already compressed
+    return PickleSerializer().dumps(buffer.getvalue())
+
+
+def json_records(count: int = 100_000) -> bytes:
+    records = [
+        dict(id=i, user=f"user_{i % 1000}", status="active" if i % 3 else "inactive", score=i % 97)
+        for i in range(count)
+    ]
+    return JSONSerializer().dumps(records)
+
+
+PAYLOADS: Dict[str, Callable[[], bytes]] = {
+    "small_int": small_int,
+    "large_dataframe": large_dataframe,
+    "image_bytes": image_bytes,
+    "json": json_records,
+}
+
+
+def throughput(fn: Callable, size: int, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return round(size / MB / max(min(timings), 1e-9), 1)
+
+
+def benchmark(repeats: int = 3) -> List[Dict]:
+    reports = []
+    for payload, make_payload in PAYLOADS.items():
+        blob = make_payload()
+        for codec, (compress, decompress, levels) in CODECS.items():
+            for level in levels:
+                compressed = compress(blob, level)
+                report = dict(
+                    payload=payload,
+                    size_mb=round(len(blob) / MB, 3),
+                    codec=codec,
+                    level=level,
+                    ratio=round(len(blob) / len(compressed), 2),
+                    compress_mb_per_sec=throughput(lambda: compress(blob, level), len(blob), repeats),
+                    decompress_mb_per_sec=throughput(
+                        lambda: decompress(compressed), len(blob), repeats
+                    ),
+                )
+                reports.append(report)
+                print(report, file=sys.stderr)
+        for policy in ("speed", "ratio", "balanced"):
+            codec, level = AutoCompressedSerializer(policy=policy).choose_codec(blob)
+            reports.append(dict(payload=payload, policy=policy, codec=codec, level=level))
+            print(f"auto with policy={policy} on {payload}: {codec}:{level}", file=sys.stderr)
+    return reports
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark(), indent=2))
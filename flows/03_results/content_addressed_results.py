@@ -0,0 +1,34 @@
+"""
+python blocks/custom/content_addressed_result_storage.py
+100 mapped task runs return only 4 distinct results, so only 4 result blobs (+1 for the flow result)
+are written to S3 under dev/blobs/ - with the s3/dev block, there would be 101 of them.
+aws s3 ls s3://prefect-orion/dev/blobs/ | wc -l
+
+Once references of old results are deleted, remove the blobs no longer referenced:
+ContentAddressedResultStorage.load("dev").collect_garbage()
+"""
+from prefect import flow, task
+
+# registers the block type, so that the "content-addressed-result-storage/dev" slug can be resolved
+from blocks.custom.content_addressed_result_storage import ContentAddressedResultStorage  # noqa: F401
+
+
+@task
+def extract() -> list:
+    return list(range(100))
+
+
+@task
+def transform(x: int) -> list:
+    return [x % 4] * 100_000
+
+
+@flow(persist_result=True, result_storage="content-addressed-result-storage/dev")
+def deduplicated_results():
+    nrs = extract.submit()
+    transformed = transform.map(nrs)
+    return len({tuple(t.result()) for t in transformed})
+
+
+if __name__ == "__main__":
+    deduplicated_results()
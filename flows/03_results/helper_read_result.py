@@ -1,20 +1,260 @@
+"""
+Reads and inspects persisted results in bulk, from a local directory or any remote path supported by fsspec.
+Result files are read concurrently in threads and summarized in a process pool.
+The summary of a result (serializer, size and the type of the object) is taken from the first bytes
+of its data, without deserializing the whole object. Only the beginning and the end of each file are read,
+so it is cheap even for large DataFrames.
+
+python flows/03_results/helper_read_result.py ~/.prefect/storage
+python flows/03_results/helper_read_result.py s3://prefect-orion/dev --flow-run-id <id> --output results.jsonl
+
+read_result() deserializes a single result completely.
+"""
+import argparse
+import asyncio
+import base64
+import bz2
 import json
+import lzma
+import pickletools
+import re
+import os
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from uuid import UUID
+import fsspec
+from prefect import get_client
+from prefect.orion.schemas.filters import FlowRunFilter, FlowRunFilterId
 from prefect.results import PersistedResultBlob
-from prefect.serializers import PickleSerializer, JSONSerializer
+
+DATA_PATTERN = re.compile(rb'"data"\s*:\s*"')
+SERIALIZER_PATTERN = re.compile(rb'"serializer"\s*:\s*')
+VERSION_PATTERN = re.compile(rb'"prefect_version"\s*:\s*"([^"]*)"')
+JSON_STRING_PATTERN = re.compile(rb'(?:[^"\\]|\\.)*')  # up to the closing quote
+PREFIX_BYTES = 4096  # of the deserialized data, enough for the first pickle opcodes
+COMPRESSED_PREFIX_BYTES = 64 * 1024
+# read from each file: the serializer settings and enough base64 data for the prefixes above,
+# and the end of the data followed by the prefect version
+HEAD_BYTES = 256 * 1024
+TAIL_BYTES = 1024
+DECOMPRESSORS = {
+    "zlib": lambda: zlib.decompressobj(),
+    "lzma": lambda: lzma.LZMADecompressor(),
+    "bz2": lambda: bz2.BZ2Decompressor(),
+}
+PICKLE_TYPES = {
+    "EMPTY_DICT": "dict",
+    "EMPTY_LIST": "list",
+    "EMPTY_SET": "set",
+    "EMPTY_TUPLE": "tuple",
+    "NONE": "NoneType",
+    "NEWTRUE": "bool",
+    "NEWFALSE": "bool",
+    "BININT": "int",
+    "BININT1": "int",
+    "BININT2": "int",
+    "LONG1": "int",
+    "BINFLOAT": "float",
+    "SHORT_BINUNICODE": "str",
+    "BINUNICODE": "str",
+    "SHORT_BINBYTES": "bytes",
+    "BINBYTES": "bytes",
+}
+# the last opcode before STOP tells which container holds the values pushed before it
+CONTAINER_OPS = {"TUPLE1": "tuple", "TUPLE2": "tuple", "TUPLE3": "tuple", "TUPLE": "tuple"}
+
+
+def read_result(path: str) -> Any:
+    with fsspec.open(path, "rb") as f:
+        blob = PersistedResultBlob.parse_raw(f.read())
+    return blob.serializer.loads(blob.data)
+
+
+def list_result_files(path: str) -> Iterator[Tuple[str, int]]:
+    fs, root = fsspec.core.url_to_fs(path)
+    for file, info in fs.find(root, detail=True).items():
+        yield fs.unstrip_protocol(file), info["size"]
+
+
+async def read_all(read, page_size: int = 200, **filters) -> list:
+    runs, offset = [], 0
+    while True:
+        page = await read(limit=page_size, offset=offset, **filters)
+        runs += page
+        offset += page_size
+        if len(page) < page_size:
+            return runs
+
+
+async def get_storage_keys(flow_run_id: UUID) -> Set[str]:
+    """Storage keys of the results of a flow run and of all its task runs, according to the API."""
+    async with get_client() as client:
+        states = await client.read_flow_run_states(flow_run_id)
+        run_filter = FlowRunFilter(id=FlowRunFilterId(any_=[flow_run_id]))
+        task_runs = await read_all(client.read_task_runs, flow_run_filter=run_filter)
+    states += [task_run.state for task_run in task_runs if task_run.state]
+    keys = set()
+    for state in states:
+        data = state.data.dict() if hasattr(state.data, "dict") else state.data
+        if isinstance(data, dict) and data.get("storage_key"):
+            keys.add(data["storage_key"])
+    return keys
+
+
+def b64_prefix(data: bytes, size: int) -> bytes:
+    # base64 lines end with a newline, escaped as "\n" when the data is embedded in JSON
+    encoded = data[: size * 2].replace(b"\\n", b"").replace(b"\n", b"")
+    return base64.b64decode(encoded[: len(encoded) // 4 * 4])
+
+
+def decode_prefix(data: bytes, serializer: Dict[str, Any]) -> Tuple[str, bytes]:
+    """Returns the innermost serializer type and the first bytes it would deserialize."""
+    serializer_type = serializer["type"]
+    if serializer_type == "json":
+        return serializer_type, data[:PREFIX_BYTES]
+    if serializer_type == "arrow":  # utilities/serializers.py, the first byte tells the format
+        if data[:1] == b"F":
+            return decode_prefix(data[1:], serializer["fallback"])
+        return serializer_type, data[:1]
+    if serializer_type == "compressed/auto":  # utilities/serializers.py, prefixed with "codec:level:"
+        codec, _, data = data.split(b":", 2)
+        if codec == b"none":
+            inner = b64_prefix(data, PREFIX_BYTES * 2)
+        else:
+            compressed = b64_prefix(data, COMPRESSED_PREFIX_BYTES)
+            inner = DECOMPRESSORS[codec.decode()]().decompress(compressed, PREFIX_BYTES * 2)
+        return decode_prefix(inner, serializer["serializer"])
+    if serializer_type.startswith("compressed"):
+        library = serializer.get("compressionlib", "lzma").rsplit(".", 1)[-1]
+        # decompressing the beginning of the stream is enough to get the beginning of the data
+        compressed = b64_prefix(data, COMPRESSED_PREFIX_BYTES)
+        inner = DECOMPRESSORS[library]().decompress(compressed, PREFIX_BYTES * 2)
+        return decode_prefix(inner, serializer["serializer"])
+    return serializer_type, b64_prefix(data, PREFIX_BYTES)
 
 
-def read_result(filename: str, serialier: str = "pickle"):
-    path = f"/Users/anna/repos/prefect-deployment-patterns/results/qa/files/{filename}"
-    with open(path, "rb") as buffered_reader:
-        dict_obj = json.load(buffered_reader)
-        blob = PersistedResultBlob.parse_obj(dict_obj)
-    if serialier == "json":
-        result = JSONSerializer().loads(blob.data)
+def pickled_type(prefix: bytes) -> str:
+    """Infers the type of a pickled object from its first opcodes without unpickling it."""
+    ops: List[Tuple[str, Any]] = []
+    try:
+        for opcode, arg, _ in pickletools.genops(prefix):
+            if opcode.name not in ("PROTO", "FRAME", "MEMOIZE"):
+                ops.append((opcode.name, arg))
+            if opcode.name in ("STACK_GLOBAL", "GLOBAL"):
+                break
+    except ValueError:  # the prefix ends in the middle of an opcode
+        pass
+    if not ops:
+        return "unknown"
+    name, arg = ops[-1]
+    if name == "STACK_GLOBAL" and len(ops) >= 3:  # module and name were pushed as strings
+        return f"{ops[-3][1]}.{ops[-2][1]}"
+    if name == "GLOBAL":
+        return arg.replace(" ", ".")
+    if len(ops) > 1 and ops[-1][0] == "STOP" and ops[-2][0] in CONTAINER_OPS:
+        return CONTAINER_OPS[ops[-2][0]]
+    return PICKLE_TYPES.get(ops[0][0], "unknown")
+
+
+def json_type(prefix: bytes) -> str:
+    first = prefix.lstrip()[:1].replace(b"\\", b'"')  # quotes are escaped within the blob
+    types = {b"{": "dict", b"[": "list", b'"': "str", b"n": "NoneType", b"t": "bool", b"f": "bool"}
+    return types.get(first, "int/float" if first else "unknown")
+
+
+def read_head_and_tail(fs, path: str, size: int) -> bytes:
+    if size <= HEAD_BYTES + TAIL_BYTES:
+        return fs.cat_file(path)
+    # the bytes in between are only data
+    return fs.cat_file(path, start=0, end=HEAD_BYTES) + fs.cat_file(path, start=size - TAIL_BYTES)
+
+
+def summarize(path: str, content: bytes, size: int) -> Dict[str, Any]:
+    """content is the whole file or its beginning and end, as returned by read_head_and_tail()."""
+    summary = dict(path=path, size=size)
+    try:
+        serializer_match = SERIALIZER_PATTERN.search(content)
+        data_match = DATA_PATTERN.search(content)
+        start = serializer_match.end()
+        # the serializer settings are short, the data is not decoded as JSON at all
+        serializer, _ = json.JSONDecoder().raw_decode(content[start : start + 64 * 1024].decode())
+        data = JSON_STRING_PATTERN.match(content, data_match.end()).group()
+        inner_type, prefix = decode_prefix(data, serializer)
+    except (AttributeError, ValueError, KeyError, LookupError, zlib.error, lzma.LZMAError) as exc:
+        summary["error"] = f"not a readable result: {exc!r}"
+        return summary
+    version = VERSION_PATTERN.search(content)
+    summary["serializer"] = serializer["type"]
+    if "compressionlib" in serializer:
+        summary["compressionlib"] = serializer["compressionlib"]
+    summary["data_size"] = len(data) + size - len(content)
+    summary["prefect_version"] = version.group(1).decode() if version else None
+    if inner_type == "json":
+        summary["type"] = json_type(prefix)
+    elif inner_type == "arrow":
+        summary["type"] = "pandas.core.frame.DataFrame" if prefix in (b"A", b"P") else "unknown"
     else:
-        result = PickleSerializer().loads(blob.data)
-    return result
+        summary["type"] = pickled_type(prefix)
+    return summary
+
+
+def summarize_batch(batch: List[Tuple[str, bytes, int]]) -> List[Dict[str, Any]]:
+    return [summarize(path, content, size) for path, content, size in batch]
+
+
+def inspect_results(
+    path: str,
+    flow_run_id: Optional[UUID] = None,
+    max_threads: int = 32,
+    max_processes: Optional[int] = None,
+    batch_size: int = 512,
+) -> Iterator[Dict[str, Any]]:
+    fs, _ = fsspec.core.url_to_fs(path)
+    files = list_result_files(path)
+    if flow_run_id:
+        keys = asyncio.run(get_storage_keys(flow_run_id))
+        files = (f for f in files if f[0].rsplit("/", 1)[-1] in keys)
+    max_processes = max_processes or os.cpu_count()
+    with ThreadPoolExecutor(max_threads) as threads, ProcessPoolExecutor(max_processes) as processes:
+        batch = []
+        for file in files:
+            batch.append(file)
+            if len(batch) == batch_size:
+                yield from summarize_files(fs, batch, threads, processes, max_processes)
+                batch = []
+        yield from summarize_files(fs, batch, threads, processes, max_processes)
+
+
+def summarize_files(
+    fs, files: List[Tuple[str, int]], threads, processes, max_processes: int
+) -> Iterator[Dict[str, Any]]:
+    paths, sizes = [f[0] for f in files], [f[1] for f in files]
+    heads = threads.map(read_head_and_tail, [fs] * len(files), paths, sizes)
+    contents = list(zip(paths, heads, sizes))
+    # a few files per process call, so that pickling the contents back and forth doesn't dominate
+    per_process = max(len(contents) // (max_processes * 4), 1)
+    batches = [contents[i : i + per_process] for i in range(0, len(contents), per_process)]
+    for summaries in processes.map(summarize_batch, batches):
+        yield from summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path", help="local directory or remote path, e.g. s3://bucket/dev")
+    parser.add_argument("--flow-run-id", type=UUID, help="only results of this flow run")
+    parser.add_argument("--output", help="write the summaries to this JSONL file")
+    args = parser.parse_args()
+    output = open(args.output, "w") if args.output else sys.stdout
+    count, size = 0, 0
+    for summary in inspect_results(args.path, args.flow_run_id):
+        count, size = count + 1, size + summary["size"]
+        output.write(json.dumps(summary) + "\n")
+    if args.output:
+        output.close()
+    print(f"{count} results, {size / 1024**2:.1f} MB", file=sys.stderr)
 
 
 if __name__ == "__main__":
-    x = "5bb365beb0e2487fbac2c34d378d0882"
-    print(read_result(x))
+    main()
@@ -0,0 +1,83 @@
+"""
+Compares result serializers on DataFrames of 1M rows: size of the persisted blob,
+and how long it takes to serialize (dumps) and deserialize (loads) it.
+Each measurement is the best of a few repeats.
+
+pip install pyarrow
+python flows/03_results/serializer_benchmark.py > serializer_benchmark.json
+"""
+import json
+import sys
+import time
+import numpy as np
+import pandas as pd
+from prefect.serializers import CompressedSerializer, PickleSerializer, Serializer
+from typing import Callable, Dict, List
+from utilities.serializers import ArrowSerializer
+
+SERIALIZERS = {
+    "pickle": PickleSerializer(),
+    "compressed/pickle": CompressedSerializer(serializer="pickle"),  # lzma
+    "compressed/pickle zlib": CompressedSerializer(serializer="pickle", compressionlib="zlib"),
+    "arrow ipc zstd": ArrowSerializer(),
+    "arrow ipc": ArrowSerializer(compression=None),
+    "arrow parquet zstd": ArrowSerializer(format="parquet"),
+}
+
+
+def numeric_frame(rows: int, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "id": np.arange(rows),
+            "amount": rng.random(rows).round(2),
+            "quantity": rng.integers(0, 100, rows),
+        }
+    )
+
+
+def wide_frame(rows: int, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.random((rows, 20))).add_prefix("metric_")
+    df["country"] = rng.choice(["DE", "PL", "US", "FR"], rows)
+    df["created_at"] = pd.Timestamp("2022-01-01") + pd.to_timedelta(np.arange(rows), "s")
+    return df
+
+
+FRAMES = {"numeric": numeric_frame, "wide": wide_frame}
+
+
+def best_of(fn: Callable, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def measure(serializer: Serializer, df: pd.DataFrame, repeats: int) -> Dict[str, float]:
+    blob = serializer.dumps(df)
+    assert serializer.loads(blob).equals(df)
+    return dict(
+        size_mb=round(len(blob) / 1024**2, 2),
+        dumps_seconds=round(best_of(lambda: serializer.dumps(df), repeats), 3),
+        loads_seconds=round(best_of(lambda: serializer.loads(blob), repeats), 3),
+    )
+
+
+def benchmark(
+    rows: int = 1_000_000, serializers: List[str] = list(SERIALIZERS), repeats: int = 3
+) -> List[Dict[str, float]]:
+    reports = []
+    for frame, make_frame in FRAMES.items():
+        df = make_frame(rows)
+        for name in serializers:
+            report = measure(SERIALIZERS[name], df, repeats)
+            reports.append(dict(frame=frame, rows=rows, serializer=name, **report))
+            print(f"{name} on {frame} frame: {report}", file=sys.stderr)
+    return reports
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark(), indent=2))
@@ -0,0 +1,100 @@
+"""
+asyncio.gather(*coros) starts all coroutines at once: with thousands of async task calls,
+thousands of task runs hit the API and the remote endpoints at the same time.
+FanOut.gather() runs at most `limit` of them at a time, optionally starting no more than `rate` per second,
+and records how long each call took.
+
+fan_out = FanOut(limit=10, rate=50)
+results = await fan_out.gather(*[my_async_task(x) for x in items], return_exceptions=True)
+print(fan_out.stats())
+
+Works with both styles of simple.py and simple_with_submit.py:
+calling an async task returns a coroutine, which creates the task run only once awaited,
+and for .submit(), the call is only done once the result of the returned future is available.
+"""
+import asyncio
+import bisect
+import inspect
+import statistics
+import time
+from typing import Any, Awaitable, Dict, List, Optional, Sequence
+from prefect.futures import PrefectFuture
+
+BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)  # upper bounds in seconds
+
+
+class FanOut:
+    def __init__(
+        self, limit: int = 10, rate: Optional[float] = None, buckets: Sequence[float] = BUCKETS
+    ):
+        self.limit = limit
+        self.rate = rate
+        self.buckets = buckets
+        self.latencies: List[float] = []
+        self.errors = 0
+        self._semaphore = asyncio.Semaphore(limit)
+        self._rate_lock = asyncio.Lock()
+        self._next_start = 0.0
+
+    async def _wait_for_rate_limit(self) -> None:
+        if not self.rate:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._rate_lock:
+            now = loop.time()
+            start = max(now, self._next_start)
+            self._next_start = start + 1 / self.rate
+        await asyncio.sleep(start - now)
+
+    async def _run(self, aw: Awaitable) -> Any:
+        try:
+            async with self._semaphore:
+                await self._wait_for_rate_limit()
+                start = time.perf_counter()
+                try:
+                    result = await aw
+                    if isinstance(result, PrefectFuture):  # task.submit()
+                        result = await result.result()
+                except Exception:
+                    self.errors += 1
+                    raise
+                finally:
+                    self.latencies.append(time.perf_counter() - start)
+                return result
+        except asyncio.CancelledError:
+            if inspect.iscoroutine(aw):
+                aw.close()  # never started, no "coroutine was never awaited" warning
+            raise
+
+    async def gather(self, *aws: Awaitable, return_exceptions: bool = False) -> List[Any]:
+        """
+        Like asyncio.gather: results are returned in the order of aws and, with return_exceptions=True,
+        exceptions are returned instead of raised. Otherwise, the first exception cancels the calls not done yet.
+        """
+        tasks = [asyncio.ensure_future(self._run(aw)) for aw in aws]
+        try:
+            return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        histogram = {f"<={bound}s": 0 for bound in self.buckets}
+        histogram[f">{self.buckets[-1]}s"] = 0
+        labels = list(histogram)
+        for latency in latencies:
+            histogram[labels[bisect.bisect_left(self.buckets, latency)]] += 1
+        quantiles = (
+            statistics.quantiles(latencies, n=100, method="inclusive")
+            if len(latencies) > 1
+            else latencies * 99
+        )
+        return dict(
+            calls=len(latencies),
+            errors=self.errors,
+            latency_p50=round(quantiles[49], 3) if quantiles else None,
+            latency_p95=round(quantiles[94], 3) if quantiles else None,
+            latency_max=round(latencies[-1], 3) if latencies else None,
+            histogram=histogram,
+        )
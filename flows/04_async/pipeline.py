@@ -0,0 +1,81 @@
+"""
+Runs async stages (e.g. transform and load tasks) as a pipeline instead of one item at a time.
+Each stage has its own number of workers and reads its items from a bounded asyncio.Queue filled by the previous stage.
+When a stage falls behind, the queue in front of it fills up, and the stages before it (up to the extract)
+wait until there is room again, so no more than queue_size items per stage are held in memory.
+
+stats = await run_pipeline(extract(), (transform, 8), (load, 4), queue_size=16)
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, Iterable, List, Tuple, Union
+
+Stage = Tuple[Callable[[Any], Awaitable[Any]], int]  # async function, number of workers
+
+_DONE = object()
+
+
+async def _iterate(items: Union[Iterable, AsyncIterable]):
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def run_pipeline(
+    items: Union[Iterable, AsyncIterable],
+    *stages: Stage,
+    queue_size: int = 16,
+    collect: bool = False,
+) -> Dict[str, Any]:
+    """
+    Passes items through the stages, the output of one stage being the input of the next one.
+    The first exception raised by a stage cancels the whole pipeline and is raised.
+    With collect=True, the outputs of the last stage are returned (in order of completion).
+    """
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+    processed = [0] * len(stages)
+    outputs: List[Any] = []
+    start = time.perf_counter()
+
+    async def produce():
+        async for item in _iterate(items):
+            await queues[0].put(item)  # waits while the first stage is behind
+        for _ in range(stages[0][1]):
+            await queues[0].put(_DONE)
+
+    async def work(index: int, fn: Callable[[Any], Awaitable[Any]]):
+        while (item := await queues[index].get()) is not _DONE:
+            output = await fn(item)
+            processed[index] += 1
+            if index + 1 < len(stages):
+                await queues[index + 1].put(output)
+            elif collect:
+                outputs.append(output)
+
+    async def run_stage(index: int, fn: Callable[[Any], Awaitable[Any]], workers: int):
+        await asyncio.gather(*[work(index, fn) for _ in range(workers)])
+        # the next stage only finishes once all workers of this one are done
+        if index + 1 < len(stages):
+            for _ in range(stages[index + 1][1]):
+                await queues[index + 1].put(_DONE)
+
+    tasks = [asyncio.create_task(produce())]
+    tasks += [asyncio.create_task(run_stage(i, fn, n)) for i, (fn, n) in enumerate(stages)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    seconds = time.perf_counter() - start
+    stats = dict(
+        items=processed[-1] if stages else 0,
+        processed=processed,
+        seconds=round(seconds, 3),
+        items_per_sec=round(processed[-1] / seconds, 1) if stages and seconds else 0,
+    )
+    if collect:
+        stats["outputs"] = outputs
+    return stats
@@ -0,0 +1,62 @@
+"""
+Throughput of the sequential loop of practical.py vs. run_pipeline() when transform is I/O-bound.
+The stages are plain coroutines sleeping for a fixed latency, so that only the scheduling is compared,
+without the overhead of creating task runs.
+
+python flows/04_async/pipeline_benchmark.py > pipeline_benchmark.json
+"""
+import asyncio
+import json
+import sys
+import time
+from typing import Dict, List
+from pipeline import run_pipeline
+
+
+def make_stages(transform_latency: float, load_latency: float):
+    async def transform(x: int) -> int:
+        await asyncio.sleep(transform_latency)
+        return x * 2
+
+    async def load(x: int) -> None:
+        await asyncio.sleep(load_latency)
+
+    return transform, load
+
+
+async def sequential(items: int, transform, load) -> float:
+    start = time.perf_counter()
+    for n in range(items):
+        final = await transform(n)
+        await load(final)
+    return time.perf_counter() - start
+
+
+async def pipelined(items: int, transform, load, workers: int, queue_size: int) -> float:
+    stats = await run_pipeline(
+        range(items), (transform, workers), (load, max(workers // 2, 1)), queue_size=queue_size
+    )
+    return stats["seconds"]
+
+
+def benchmark(
+    items: int = 200,
+    transform_latency: float = 0.05,
+    load_latency: float = 0.01,
+    workers: List[int] = [1, 4, 16, 64],
+    queue_size: int = 16,
+) -> List[Dict[str, float]]:
+    transform, load = make_stages(transform_latency, load_latency)
+    seconds = asyncio.run(sequential(items, transform, load))
+    reports = [dict(variant="sequential", workers=1, seconds=round(seconds, 3))]
+    for n in workers:
+        seconds = asyncio.run(pipelined(items, transform, load, n, queue_size))
+        reports.append(dict(variant="pipeline", workers=n, seconds=round(seconds, 3)))
+    for report in reports:
+        report["items_per_sec"] = round(items / report["seconds"], 1)
+        print(report, file=sys.stderr)
+    return reports
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark(), indent=2))
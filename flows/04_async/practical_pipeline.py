@@ -0,0 +1,37 @@
+"""
+The same ETL as practical.py, but transform and load run as a pipeline:
+up to 4 numbers are transformed and 2 loaded at the same time, instead of one after another.
+python flows/04_async/pipeline_benchmark.py compares both.
+"""
+import asyncio
+
+from prefect import task, flow, get_run_logger
+from pipeline import run_pipeline
+
+
+@task(log_prints=True)
+async def extract() -> list:
+    return list(range(1, 11))
+
+
+@task(log_prints=True)
+async def transform(x: int) -> int:
+    await asyncio.sleep(1)  # e.g. calling an API
+    return x * 2
+
+
+@task(log_prints=True)
+async def load(x: int) -> None:
+    await asyncio.sleep(0.5)  # e.g. writing to a database
+    print(f"final result {x}")
+
+
+@flow(log_prints=True)
+async def async_etl_pipeline(transform_workers: int = 4, load_workers: int = 2):
+    nrs = await extract()
+    stats = await run_pipeline(nrs, (transform, transform_workers), (load, load_workers))
+    get_run_logger().info("Pipeline: %s", stats)
+
+
+if __name__ == "__main__":
+    asyncio.run(async_etl_pipeline())
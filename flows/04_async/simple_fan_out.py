@@ -0,0 +1,44 @@
+"""
+Like simple.py and simple_with_submit.py, but with 100 task calls of which at most 10 run at a time,
+and no more than 20 start per second.
+"""
+import asyncio
+import random
+
+from prefect import task, flow, get_run_logger
+from fan_out import FanOut
+
+
+@task(log_prints=True)
+async def print_values(values):
+    for value in values:
+        await asyncio.sleep(random.random())  # yield
+        print(value, end=" ")
+    if random.random() < 0.05:
+        raise ValueError("Failing once in a while")
+    return len(values)
+
+
+@flow(log_prints=True)
+async def async_flow():
+    fan_out = FanOut(limit=10, rate=20)
+    coros = [print_values("abcd") for _ in range(100)]
+    results = await fan_out.gather(*coros, return_exceptions=True)
+    failed = sum(isinstance(result, Exception) for result in results)
+    get_run_logger().info("%s failed. Stats: %s", failed, fan_out.stats())
+    return failed  # the flow run completes even though some task runs failed
+
+
+@flow(log_prints=True)
+async def async_flow_with_submit():
+    fan_out = FanOut(limit=10, rate=20)
+    futures = [print_values.submit("6789") for _ in range(100)]
+    results = await fan_out.gather(*futures, return_exceptions=True)
+    failed = sum(isinstance(result, Exception) for result in results)
+    get_run_logger().info("%s failed. Stats: %s", failed, fan_out.stats())
+    return failed  # the flow run completes even though some task runs failed
+
+
+if __name__ == "__main__":
+    asyncio.run(async_flow())
+    asyncio.run(async_flow_with_submit())
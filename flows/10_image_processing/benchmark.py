@@ -0,0 +1,166 @@
+"""
+Benchmark of the thumbnail flows in this directory on a deterministic synthetic corpus.
+
+Every variant runs in a fresh process against a temporary local API (prefect_test_harness),
+so that peak memory and the number of task runs are measured per variant.
+Per variant and corpus, the JSON report contains:
+- images_per_sec: number of images divided by the wall time of the flow run
+- completion_p50/p95: seconds from the start of the flow run of an extension until the thumbnail
+  of an image was written, i.e. how long it takes until half (95%) of the thumbnails are available,
+  not how long each image took
+- task_runs and task_run_overhead: wall time above the reference run (the same images resized
+  in a process pool without Prefect), divided by the number of task runs
+- peak_rss_mb and peak_child_rss_mb: max resident memory of the flow process and of its worker processes
+
+pip install pytest  # required by prefect.testing
+python flows/10_image_processing/benchmark.py > benchmark.json
+"""
+import asyncio
+import importlib
+import json
+import random
+import resource
+import shutil
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import get_context
+from pathlib import Path
+from PIL import Image, ImageDraw
+from prefect import get_client
+from prefect.testing.utilities import prefect_test_harness
+from typing import Dict, List, Tuple
+from thumbnails_batched import make_thumbnail
+
+RESOLUTIONS = [(640, 480), (1920, 1080), (4000, 3000)]
+CORPORA = [100, 1000]
+
+# variant name: (module, extra flow kwargs, output directory relative to in_dir)
+VARIANTS = {
+    "mapped": ("thumbnails", {}, "thumbnails_mapped"),
+    "for_loop": ("thumbnails_for_loop", {}, "thumbnails"),
+    "batched": ("thumbnails_batched", {"incremental": False}, "thumbnails_batched/128x128"),
+    "vectorized": (
+        "thumbnails_batched",
+        {"incremental": False, "vectorized": True},
+        "thumbnails_batched/128x128",
+    ),
+}
+
+
+def create_corpus(corpus_dir: Path, count: int, seed: int = 42) -> None:
+    """Writes the same mix of JPEG and PNG images of various resolutions for a given seed."""
+    rng = random.Random(seed)
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    for i in range(count):
+        width, height = rng.choice(RESOLUTIONS)
+        im = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        draw = ImageDraw.Draw(im)
+        for _ in range(20):
+            x, y = rng.randrange(width), rng.randrange(height)
+            r = rng.randrange(10, max(11, width // 4))
+            fill = tuple(rng.randrange(256) for _ in range(3))
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=fill)
+        extension = "jpg" if i % 2 == 0 else "png"
+        im.save(corpus_dir / f"img_{i:06d}.{extension}")
+
+
+def percentile(values: List[float], q: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+async def count_task_runs(page_size: int = 200) -> int:
+    async with get_client() as client:
+        total, offset = 0, 0
+        while True:
+            task_runs = await client.read_task_runs(limit=page_size, offset=offset)
+            total += len(task_runs)
+            offset += page_size
+            if len(task_runs) < page_size:
+                return total
+
+
+def run_reference(in_dir: str, extensions: Tuple[str, ...]) -> float:
+    out_dir = Path(in_dir, "thumbnails_reference")
+    Path(out_dir, "128x128").mkdir(parents=True, exist_ok=True)
+    files = [f for ext in extensions for f in Path(in_dir).glob(f"*.{ext}")]
+    # thumbnails keep the extension of their image, as in the variants
+    suffixes = [f.suffix[1:] for f in files]
+    args = (files, repeat(out_dir), repeat([(128, 128)]), suffixes)
+    start = time.perf_counter()
+    with ProcessPoolExecutor() as pool:
+        list(pool.map(make_thumbnail, *args))
+    seconds = time.perf_counter() - start
+    shutil.rmtree(out_dir)
+    return seconds
+
+
+def run_variant(variant: str, in_dir: str, extensions: Tuple[str, ...]) -> Dict[str, float]:
+    module_name, kwargs, out_dir = VARIANTS[variant]
+    generate_thumbnails = importlib.import_module(module_name).generate_thumbnails
+    shutil.rmtree(Path(in_dir, out_dir.split("/")[0]), ignore_errors=True)
+    with prefect_test_harness():
+        asyncio.run(count_task_runs())  # creates the temporary database before timing starts
+        starts, start = {}, time.perf_counter()
+        for extension in extensions:
+            starts[extension] = time.time()
+            generate_thumbnails(in_dir=in_dir, extension=extension, **kwargs)
+        seconds = time.perf_counter() - start
+        task_runs = asyncio.run(count_task_runs())
+    # thumbnails keep the extension of their image, so each one is timed from the start of its own run
+    completions = [
+        f.stat().st_mtime - starts[f.suffix[1:]] for f in Path(in_dir, out_dir).iterdir()
+    ]
+    return dict(
+        seconds=seconds,
+        images=len(completions),
+        task_runs=task_runs,
+        completions=completions,
+        peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        peak_child_rss_mb=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    )
+
+
+def benchmark(
+    corpus_root: str = "benchmark_corpus",
+    corpora: List[int] = CORPORA,
+    variants: List[str] = list(VARIANTS),
+    extensions: Tuple[str, ...] = ("jpg", "png"),
+) -> List[Dict[str, float]]:
+    reports = []
+    for count in corpora:
+        in_dir = str(Path(corpus_root, f"{count}_images"))
+        if not Path(in_dir).exists():
+            create_corpus(Path(in_dir), count)
+        reference = run_reference(in_dir, extensions)
+        for variant in variants:
+            # a fresh process per variant so that peak RSS and the temporary API are not shared
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                run = pool.submit(run_variant, variant, in_dir, extensions).result()
+            reports.append(
+                dict(
+                    variant=variant,
+                    images=run["images"],
+                    seconds=round(run["seconds"], 3),
+                    images_per_sec=round(run["images"] / run["seconds"], 1),
+                    completion_p50=round(percentile(run["completions"], 50), 3),
+                    completion_p95=round(percentile(run["completions"], 95), 3),
+                    task_runs=run["task_runs"],
+                    task_run_overhead=round(
+                        max(run["seconds"] - reference, 0) / max(run["task_runs"], 1), 4
+                    ),
+                    reference_seconds=round(reference, 3),
+                    peak_rss_mb=round(run["peak_rss_mb"], 1),
+                    peak_child_rss_mb=round(run["peak_child_rss_mb"], 1),
+                )
+            )
+            print(f"{variant} on {count} images: {run['seconds']:.2f}s", file=sys.stderr)
+    return reports
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark(), indent=2))
@@ -8,6 +8,11 @@ unzip cats.zip
 ls cats | wc -l
 python flows/10_image_processing/thumbnails.py
 ls cats/thumbnails | wc -l
+
+Image.thumbnail() already lets the JPEG decoder downscale by 1/2, 1/4 or 1/8 to a size
+at least twice as large as the thumbnail. With draft=True (the default), the decoder goes down
+to the smallest scale that is still as large as the thumbnail, which saves a little more decoding
+at a small cost in quality. draft=False calls Image.thumbnail() with its defaults.
 """
 from pathlib import Path, PosixPath
 from PIL import Image
@@ -26,22 +31,34 @@ def process_image(
     out_dir: PosixPath,
     size: Tuple[int, int] = (128, 128),
     extension: str = "png",
+    draft: bool = True,
 ):
     with Image.open(infile) as im:
-        im.thumbnail(size)
+        if draft:
+            im.draft(im.mode, size)  # no-op for anything other than JPEG
+            im.thumbnail(size, reducing_gap=1.0)
+        else:
+            im.thumbnail(size)
     im.save(Path(out_dir, infile.stem + f"-thumbnail.{extension}"))
 
 
 @flow
 def generate_thumbnails(
-    in_dir: str = "small", extension: str = "png", size: Tuple[int, int] = (128, 128)
+    in_dir: str = "small",
+    extension: str = "png",
+    size: Tuple[int, int] = (128, 128),
+    draft: bool = True,
 ):
     img_dir = Path(".", in_dir)
     out_dir = Path(".", in_dir, "thumbnails_mapped")
     images = get_images.submit(img_dir, extension)
     Path(out_dir).mkdir(parents=True, exist_ok=True)
     process_image.map(
-        images.result(), unmapped(out_dir), unmapped(size), unmapped(extension)
+        images.result(),
+        unmapped(out_dir),
+        unmapped(size),
+        unmapped(extension),
+        unmapped(draft),
     )
 
 
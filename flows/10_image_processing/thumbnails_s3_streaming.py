@@ -0,0 +1,131 @@
+"""
+Unlike thumbnails_for_loop_s3_images.py, this flow doesn't copy the whole S3 prefix to local disk first.
+Objects are listed page by page, downloaded into memory, thumbnailed and uploaded back to S3
+under out_prefix while the next downloads are already in flight.
+Thumbnails keep the path of their image below in_prefix, e.g. cats/2022/a.jpg becomes
+cats_thumbnails/128x128/2022/a-thumbnail.jpg.
+At most max_in_flight images are held in memory at any point, regardless of how many images are in the bucket,
+and nothing is written to local disk.
+
+pip install prefect-aws
+aws s3 sync cats s3://prefect-orion/cats
+python flows/10_image_processing/thumbnails_s3_streaming.py
+aws s3 ls s3://prefect-orion/cats_thumbnails/128x128/ | wc -l
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from io import BytesIO
+from pathlib import PurePosixPath
+from PIL import Image
+from prefect import task, flow, get_run_logger
+from prefect_aws import AwsCredentials
+from typing import Dict, Iterator, List, Tuple
+from thumbnails_batched import resize_progressively
+
+
+def key_prefix(prefix: str) -> str:
+    # with a trailing "/", so that "cats" doesn't also list "cats2/..." or "cats_thumbnails/..."
+    return f"{prefix.strip('/')}/" if prefix.strip("/") else ""
+
+
+def list_images(client, bucket: str, prefix: str, extension: str) -> Iterator[str]:
+    # lazily yields keys as list_objects_v2 pages (1,000 keys each) come in
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=key_prefix(prefix)):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(f".{extension}"):
+                yield obj["Key"]
+
+
+def thumbnail_key(
+    key: str, in_prefix: str, out_prefix: str, size: Tuple[int, int], extension: str
+) -> str:
+    # keeps the path below in_prefix, so that cats/2022/a.jpg and cats/2023/a.jpg don't collide
+    relative = PurePosixPath(key[len(key_prefix(in_prefix)) :])
+    name = relative.with_name(f"{relative.stem}-thumbnail.{extension}")
+    return f"{key_prefix(out_prefix)}{size[0]}x{size[1]}/{name}"
+
+
+def process_object(
+    client,
+    bucket: str,
+    key: str,
+    in_prefix: str,
+    out_prefix: str,
+    sizes: List[Tuple[int, int]],
+    extension: str,
+    draft: bool = True,
+) -> int:
+    body = client.get_object(Bucket=bucket, Key=key)["Body"].read()
+    image_format = Image.registered_extensions()[f".{extension}"]
+    with Image.open(BytesIO(body)) as im:
+        for size, thumbnail in resize_progressively(im, sizes, draft):
+            buffer = BytesIO()
+            thumbnail.save(buffer, format=image_format)
+            out_key = thumbnail_key(key, in_prefix, out_prefix, size, extension)
+            client.put_object(Bucket=bucket, Key=out_key, Body=buffer.getvalue())
+    return len(body)
+
+
+@task
+def stream_thumbnails(
+    bucket: str,
+    in_prefix: str,
+    out_prefix: str,
+    extension: str = "png",
+    sizes: List[Tuple[int, int]] = [(128, 128)],
+    max_in_flight: int = 32,
+    draft: bool = True,
+) -> Dict[str, float]:
+    logger = get_run_logger()
+    if key_prefix(out_prefix).startswith(key_prefix(in_prefix)):
+        # thumbnails uploaded while listing would be listed and thumbnailed again
+        raise ValueError(f"out_prefix {out_prefix!r} must not be within in_prefix {in_prefix!r}")
+    aws_creds = AwsCredentials.load("default")
+    client = aws_creds.get_boto3_session().client("s3")  # boto3 clients are thread-safe
+    start = time.perf_counter()
+    images, bytes_read = 0, 0
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        for key in list_images(client, bucket, in_prefix, extension):
+            if len(in_flight) >= max_in_flight:
+                # backpressure: don't list or download more until one of the images is done
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    bytes_read += future.result()
+                    images += 1
+                    if images % 1000 == 0:
+                        logger.info("Processed %s images so far", images)
+            args = (client, bucket, key, in_prefix, out_prefix, sizes, extension, draft)
+            in_flight.add(pool.submit(process_object, *args))
+        for future in wait(in_flight).done:
+            bytes_read += future.result()
+            images += 1
+    seconds = time.perf_counter() - start
+    logger.info(
+        "Processed %s images (%.1f MB) in %.2f seconds (%.1f images/sec)",
+        images,
+        bytes_read / 1024**2,
+        seconds,
+        images / seconds if seconds else 0,
+    )
+    return dict(images=images, bytes=bytes_read, seconds=round(seconds, 3))
+
+
+@flow
+def generate_thumbnails(
+    bucket: str = "prefect-orion",
+    in_prefix: str = "cats",
+    out_prefix: str = "cats_thumbnails",
+    extension: str = "png",
+    sizes: List[Tuple[int, int]] = [(128, 128)],
+    max_in_flight: int = 32,
+    draft: bool = True,
+) -> Dict[str, float]:
+    return stream_thumbnails(
+        bucket, in_prefix, out_prefix, extension, sizes, max_in_flight, draft
+    )
+
+
+if __name__ == "__main__":
+    generate_thumbnails(in_prefix="cats", extension="jpg")
@@ -0,0 +1,240 @@
+"""
+Caching helpers for tasks with a cache_key_fn.
+
+content_input_hash() is a drop-in replacement for task_input_hash, which hashes Path parameters
+by their path and contents rather than the path alone,
+and DataFrames column by column rather than pickled as a whole.
+
+memory_cached() adds an in-process LRU tier in front of the cache of a task:
+repeated calls with the same cache key within the same process return the value kept in memory,
+without creating a task run, i.e. without a round trip to the API and to the result storage.
+Misses go through the task as usual, so the persisted cache (cache_key_fn + cache_expiration) is the second tier.
+
+@memory_cached(maxsize=128)
+@task(cache_key_fn=task_input_hash, cache_expiration=timedelta(minutes=1))
+def expensive_computation() -> int:
+    ...
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import PurePath
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Optional, Tuple
+import pandas as pd
+from prefect import Task
+from prefect.client.schemas import State
+from prefect.context import FlowRunContext
+from prefect.utilities.callables import get_call_parameters
+from prefect.utilities.hashing import hash_objects
+
+_CACHES: Dict[str, "MemoryCachedTask"] = {}
+# path: (size, mtime_ns, digest), a file is only read again when its size or mtime changed
+_FILE_DIGESTS: Dict[str, Tuple[int, int, str]] = {}
+# id of a DataFrame: (weak reference to it, digest), only for the flow run in _MEMO_FLOW_RUN
+_OBJECT_DIGESTS: Dict[int, Tuple[weakref.ref, str]] = {}
+_MEMO_FLOW_RUN = dict(id=None)
+_LOCK = threading.Lock()
+
+
+class MemoryCachedTask:
+    """
+    Wraps a task with a cache_key_fn. Only direct calls are served from memory,
+    .submit() and .map() are passed to the task as they are.
+
+    The cache_key_fn is called with a stand-in for the task run context, as there is no task run yet:
+    only context.task and context.task_run.flow_run_id are available, which is what
+    task_input_hash and keys scoped to a flow run (cache_it_only_same_flow_run.py) use.
+
+    Values are never kept longer than the cached state they came from, even when the miss
+    was answered by a persisted cache entry that was about to expire.
+    Calls of async tasks return a coroutine, as the task itself does.
+    """
+
+    def __init__(self, task: Task, maxsize: int = 128, ttl: Optional[timedelta] = None):
+        if task.cache_key_fn is None:
+            raise ValueError(f"Task {task.name!r} has no cache_key_fn to cache results in memory.")
+        self.task = task
+        self.maxsize = maxsize
+        # by default, values are kept as long as the persisted cache is valid
+        self.ttl = ttl or task.cache_expiration
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = dict(hits=0, misses=0, evictions=0, expirations=0)
+
+    def _cache_key(self, args: tuple, kwargs: dict) -> Optional[str]:
+        flow_run_context = FlowRunContext.get()
+        flow_run_id = flow_run_context.flow_run.id if flow_run_context else None
+        context = SimpleNamespace(task=self.task, task_run=SimpleNamespace(flow_run_id=flow_run_id))
+        parameters = get_call_parameters(self.task.fn, args, kwargs)
+        return self.task.cache_key_fn(context, parameters)
+
+    def _get(self, key: str) -> tuple:
+        with self._lock:
+            if key not in self._entries:
+                self.stats["misses"] += 1
+                return False, None
+            value, expires_at = self._entries[key]
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return False, None
+            self._entries.move_to_end(key)  # most recently used
+            self.stats["hits"] += 1
+            return True, value
+
+    def _put(self, key: str, state: State, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl.total_seconds() if self.ttl else None
+        cache_expiration = state.state_details.cache_expiration
+        if cache_expiration is not None:
+            # counted from when the state was cached, not from when the value entered memory
+            remaining = (cache_expiration - datetime.now(timezone.utc)).total_seconds()
+            expires_at = min(expires_at or math.inf, time.monotonic() + remaining)
+        if expires_at is not None and expires_at <= time.monotonic():
+            return
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)  # least recently used
+                self.stats["evictions"] += 1
+
+    def __call__(self, *args, **kwargs):
+        if kwargs.get("return_state"):
+            return self.task(*args, **kwargs)
+        key = self._cache_key(args, kwargs)
+        if key is None:  # the key function couldn't hash the inputs
+            return self.task(*args, **kwargs)
+        flow_run_context = FlowRunContext.get()
+        in_async_flow = flow_run_context is not None and flow_run_context.flow.isasync
+        if self.task.isasync and in_async_flow:  # the task returns a coroutine
+            return self._call_async(key, args, kwargs)
+        found, value = self._get(key)
+        if found:
+            return value
+        state = self.task(*args, return_state=True, **kwargs)
+        if in_async_flow:
+            # on the event loop, the result can only be fetched through the portal of the flow run
+            value = flow_run_context.sync_portal.call(_fetch_result, state)
+        else:
+            value = state.result()
+        self._put(key, state, value)
+        return value
+
+    async def _call_async(self, key: str, args: tuple, kwargs: dict) -> Any:
+        # the value is cached, not the coroutine, which can only be awaited once
+        found, value = self._get(key)
+        if found:
+            return value
+        state = await self.task(*args, return_state=True, **kwargs)
+        value = await state.result(fetch=True)
+        self._put(key, state, value)
+        return value
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.task, name)
+
+    def cache_info(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats, size=len(self._entries), maxsize=self.maxsize)
+
+    def cache_clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+async def _fetch_result(state: State) -> Any:
+    return await state.result(fetch=True)
+
+
+def memory_cached(maxsize: int = 128, ttl: Optional[timedelta] = None):
+    def decorator(task: Task) -> MemoryCachedTask:
+        cached = MemoryCachedTask(task, maxsize=maxsize, ttl=ttl)
+        _CACHES[task.name] = cached
+        return cached
+
+    return decorator
+
+
+def get_cache_info() -> Dict[str, Dict[str, int]]:
+    """Hit, miss, eviction and expiration counters of all memory-cached tasks, by task name."""
+    return {name: cached.cache_info() for name, cached in _CACHES.items()}
+
+
+def file_digest(path: PurePath, block_size: int = 1024**2) -> str:
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    with _LOCK:
+        cached = _FILE_DIGESTS.get(path)
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha256.update(block)
+    digest = sha256.hexdigest()
+    with _LOCK:
+        _FILE_DIGESTS[path] = (stat.st_size, stat.st_mtime_ns, digest)
+    return digest
+
+
+def dataframe_digest(df: pd.DataFrame) -> str:
+    if isinstance(df, pd.Series):
+        df = df.to_frame()
+    sha256 = hashlib.sha256()
+    sha256.update(repr([(str(name), str(dtype)) for name, dtype in df.dtypes.items()]).encode())
+    # one vectorized uint64 hash per row and column, nothing is pickled
+    sha256.update(pd.util.hash_pandas_object(df.index).values.tobytes())
+    for _, column in df.items():
+        sha256.update(pd.util.hash_pandas_object(column, index=False).values.tobytes())
+    return sha256.hexdigest()
+
+
+def _memoized_digest(obj: Any, flow_run_id: Any, digest_fn: Callable[[Any], str]) -> str:
+    """
+    Computes the digest of an object once per flow run. The object must not be modified
+    in place within the flow run after it was passed to a task.
+    """
+    with _LOCK:
+        if _MEMO_FLOW_RUN["id"] != flow_run_id:
+            _OBJECT_DIGESTS.clear()
+            _MEMO_FLOW_RUN["id"] = flow_run_id
+        ref, digest = _OBJECT_DIGESTS.get(id(obj), (None, None))
+    if ref is not None and ref() is obj:  # not another object that reused the same id
+        return digest
+    digest = digest_fn(obj)
+    with _LOCK:
+        if _MEMO_FLOW_RUN["id"] == flow_run_id:
+            _OBJECT_DIGESTS[id(obj)] = (weakref.ref(obj), digest)
+    return digest
+
+
+def content_digest(value: Any, flow_run_id: Any = None) -> Any:
+    if isinstance(value, PurePath) and os.path.isfile(value):
+        # the path stays part of the key: tasks usually also depend on it, e.g. to name their output
+        return ("file", str(value), file_digest(value))
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        try:
+            return f"frame:{_memoized_digest(value, flow_run_id, dataframe_digest)}"
+        except TypeError:  # unhashable values such as lists, hashed as a whole instead
+            return value
+    return value
+
+
+def content_input_hash(context, parameters: Dict[str, Any]) -> Optional[str]:
+    """
+    Like task_input_hash, except that files passed as Path objects are hashed by their path and content
+    and DataFrames by the contents of their columns.
+    """
+    flow_run_id = context.task_run.flow_run_id
+    return hash_objects(
+        context.task.task_key,
+        context.task.fn.__code__.co_code.hex(),
+        {name: content_digest(value, flow_run_id) for name, value in parameters.items()},
+    )
@@ -0,0 +1,204 @@
+"""
+Result serializers to use alongside the ones built into prefect.serializers.
+Importing this module registers them, so it must be imported wherever the results are written or read.
+
+pip install pyarrow
+"""
+import base64
+import bz2
+import lzma
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pydantic
+from prefect.serializers import PickleSerializer, Serializer
+from typing_extensions import Literal
+
+# the first byte of a blob tells how the rest of it was serialized
+_ARROW_IPC, _PARQUET, _FALLBACK = b"A", b"P", b"F"
+
+
+class ArrowSerializer(Serializer):
+    """
+    Serializes pandas DataFrames column by column as Arrow IPC (format="ipc") or Parquet files,
+    compressed with zstd by default. Any other object is serialized with the fallback serializer,
+    as are DataFrames Arrow can't represent, e.g. with an object column mixing integers and strings.
+
+    Result blobs are embedded in JSON, so they are read from the base64-decoded bytes in memory
+    rather than from a memory-mapped file. Parquet is usually smaller but slower to decode.
+    """
+
+    type: Literal["arrow"] = "arrow"
+
+    format: Literal["ipc", "parquet"] = "ipc"
+    compression: Optional[str] = "zstd"
+    fallback: Serializer = pydantic.Field(default_factory=PickleSerializer)
+
+    @pydantic.validator("fallback", pre=True)
+    def cast_type_names_to_serializers(cls, value):
+        if isinstance(value, str):
+            return Serializer(type=value)
+        return value
+
+    def dumps(self, obj: Any) -> bytes:
+        if not isinstance(obj, pd.DataFrame):
+            return _FALLBACK + self.fallback.dumps(obj)
+        try:
+            table = pa.Table.from_pandas(obj)
+            sink = pa.BufferOutputStream()
+            if self.format == "parquet":
+                pq.write_table(table, sink, compression=self.compression)
+                prefix = _PARQUET
+            else:
+                options = pa.ipc.IpcWriteOptions(compression=self.compression)
+                with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                    writer.write_table(table)
+                prefix = _ARROW_IPC
+        except pa.ArrowException:  # e.g. ArrowTypeError on mixed types within an object column
+            return _FALLBACK + self.fallback.dumps(obj)
+        # result blobs are stored as JSON, so binary data has to be base64 encoded
+        return prefix + base64.encodebytes(sink.getvalue())
+
+    def loads(self, blob: bytes) -> Any:
+        prefix, data = blob[:1], blob[1:]
+        if prefix == _FALLBACK:
+            return self.fallback.loads(data)
+        buffer = pa.py_buffer(base64.decodebytes(data))
+        if prefix == _PARQUET:
+            table = pq.read_table(pa.BufferReader(buffer))
+        else:
+            table = pa.ipc.open_file(buffer).read_all()
+        return table.to_pandas()
+
+
+def _zlib_compress(data: bytes, level: int) -> bytes:
+    return zlib.compress(data, level)
+
+
+def _bz2_compress(data: bytes, level: int) -> bytes:
+    return bz2.compress(data, compresslevel=level)
+
+
+def _lzma_compress(data: bytes, level: int) -> bytes:
+    return lzma.compress(data, preset=level)
+
+
+# codec name: (compress(data, level), decompress(data), levels worth trying)
+CODECS: Dict[str, Tuple[Callable[[bytes, int], bytes], Callable[[bytes], bytes], List[int]]] = {
+    "zlib": (_zlib_compress, zlib.decompress, [1, 6, 9]),
+    "bz2": (_bz2_compress, bz2.decompress, [1, 9]),
+    "lzma": (_lzma_compress, lzma.decompress, [0, 6]),
+}
+# roughly from the fastest to the slowest; zlib level 9 is left out, as it is much slower than level 6
+# for about the same ratio
+CANDIDATES = [("zlib", 1), ("lzma", 0), ("zlib", 6), ("bz2", 1), ("bz2", 9), ("lzma", 6)]
+
+# (settings, payload type, size class): [codec, level, remaining results], see AutoCompressedSerializer
+_DECISIONS: Dict[tuple, list] = {}
+_LOCK = threading.Lock()
+
+
+class AutoCompressedSerializer(Serializer):
+    """
+    Like the "compressed" serializer, but picks the codec and level for each result
+    by compressing a sample of the serialized payload with every candidate.
+
+    - policy="speed": the fastest candidate that reaches min_ratio
+    - policy="ratio": the candidate with the best compression ratio
+    - policy="balanced": the candidate with the lowest time to compress, transfer at bandwidth_mb_per_sec
+      and decompress the payload, i.e. slow codecs only pay off for slow storage
+
+    Payloads that don't compress to at least min_ratio on the sample (e.g. PNG or JPEG bytes) are stored as is.
+    The chosen codec is stored with each blob, so the settings can change without breaking older results.
+
+    Candidates are tried from the fastest to the slowest, and policy="speed" stops at the first one reaching
+    min_ratio. The choice is reused for the next reuse_choice results of the same type and size class
+    (sizes within a factor of 2), so the sample is only compressed with every candidate once in a while.
+    """
+
+    type: Literal["compressed/auto"] = "compressed/auto"
+
+    serializer: Serializer = pydantic.Field(default_factory=PickleSerializer)
+    policy: Literal["speed", "ratio", "balanced"] = "balanced"
+    candidates: List[Tuple[str, int]] = CANDIDATES
+    # pickles are base64 encoded, which alone makes incompressible payloads compress to about 1.33
+    min_ratio: float = 1.4
+    bandwidth_mb_per_sec: float = 100.0
+    sample_bytes: int = 64 * 1024
+    reuse_choice: int = 100
+
+    @pydantic.validator("serializer", pre=True)
+    def cast_type_names_to_serializers(cls, value):
+        if isinstance(value, str):
+            return Serializer(type=value)
+        return value
+
+    def _sample(self, blob: bytes) -> bytes:
+        if len(blob) <= self.sample_bytes:
+            return blob
+        # the beginning, the middle and the end, as headers often compress better than the rest
+        part = self.sample_bytes // 3
+        middle = len(blob) // 2
+        return blob[:part] + blob[middle : middle + part] + blob[-part:]
+
+    def choose_codec(self, blob: bytes) -> Tuple[str, int]:
+        sample = self._sample(blob)
+        scores = []
+        for codec, level in self.candidates:
+            if self.policy == "speed" and scores and scores[-1]["ratio"] >= self.min_ratio:
+                break  # the faster candidates come first
+            compress, decompress, _ = CODECS[codec]
+            start = time.perf_counter()
+            compressed = compress(sample, level)
+            compress_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            decompress(compressed)
+            decompress_seconds = time.perf_counter() - start
+            ratio = len(sample) / max(len(compressed), 1)
+            transfer_seconds = len(compressed) / (self.bandwidth_mb_per_sec * 1024**2)
+            scores.append(
+                dict(
+                    codec=(codec, level),
+                    ratio=ratio,
+                    speed=compress_seconds,
+                    balanced=compress_seconds + transfer_seconds + decompress_seconds,
+                )
+            )
+        scores = [score for score in scores if score["ratio"] >= self.min_ratio]
+        if not scores:
+            return "none", 0
+        if self.policy == "ratio":
+            return max(scores, key=lambda score: score["ratio"])["codec"]
+        return min(scores, key=lambda score: score[self.policy])["codec"]
+
+    def _reused_choice(self, obj: Any, blob: bytes) -> Tuple[str, int]:
+        settings = (self.serializer.type, self.policy, tuple(map(tuple, self.candidates)))
+        settings += (self.min_ratio, self.bandwidth_mb_per_sec, self.sample_bytes)
+        key = (settings, type(obj).__qualname__, len(blob).bit_length())
+        with _LOCK:
+            decision = _DECISIONS.get(key)
+            if decision and decision[2] > 0:
+                decision[2] -= 1
+                return decision[0], decision[1]
+        codec, level = self.choose_codec(blob)
+        with _LOCK:
+            _DECISIONS[key] = [codec, level, self.reuse_choice]
+        return codec, level
+
+    def dumps(self, obj: Any) -> bytes:
+        blob = self.serializer.dumps(obj)
+        codec, level = self._reused_choice(obj, blob)
+        if codec != "none":
+            blob = CODECS[codec][0](blob, level)
+        return f"{codec}:{level}:".encode() + base64.encodebytes(blob)
+
+    def loads(self, blob: bytes) -> Any:
+        codec, _, data = blob.split(b":", 2)
+        data = base64.decodebytes(data)
+        if codec != b"none":
+            data = CODECS[codec.decode()][1](data)
+        return self.serializer.loads(data)